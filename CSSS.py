@@ -1,26 +1,29 @@
 import numpy as np
 import math
 from Crypto.Util import number
-import random
 import statistics
-import hashlib
+from hashing import hash64
 
 
 
 class CSSS_CountSketch():
-    def __init__(self, d, t):
+    def __init__(self, d, t, seed=None):
         # Original count sketch t = O(1/epsilon) and d = O(log(1/delta)) 
         # Think delta as U^{-c} d = O(logU)
         # d represent number of rows and t represent number of columns
+        # seed feeds the per-instance generator used for hashing and halving
+        self.rng = np.random.default_rng(seed)
         
         self.total_input = 0
         self.columns = math.ceil(t)
         
         self.rows =math.ceil(d)
-        self.prime = number.getPrime(32)
+        # drawn from the instance generator, so the seed fixes the hash functions too
+        self.prime = number.getPrime(32, randfunc=lambda n: self.rng.bytes(n))
         
-        self.table_positive = np.zeros( (self.rows, self.columns) )
-        self.table_negative = np.zeros( (self.rows, self.columns) )
+        # integer counters, np.zeros would default to float64
+        self.table_positive = np.zeros( (self.rows, self.columns), dtype=np.int64 )
+        self.table_negative = np.zeros( (self.rows, self.columns), dtype=np.int64 )
         
         # Generate 4-wise independent hash functions
         self.a = []
@@ -28,19 +31,19 @@ class CSSS_CountSketch():
         self.c = []
         self.d = []
         for i in range(d):
-            aj, bj = np.random.randint(self.prime - 1, size=2) #randomly select one number from 0 to self.prime -1
-            cj, dj = np.random.randint(self.prime - 1, size=2)
+            aj, bj = self.rng.integers(self.prime - 1, size=2) #randomly select one number from 0 to self.prime -1
+            cj, dj = self.rng.integers(self.prime - 1, size=2)
             assert aj != bj and cj!=dj
-            self.a.append(aj+1)
-            self.b.append(bj+1)
-            self.c.append(cj+1)
-            self.d.append(dj+1)
+            # python ints, so a*x + b cannot overflow int64
+            self.a.append(int(aj)+1)
+            self.b.append(int(bj)+1)
+            self.c.append(int(cj)+1)
+            self.d.append(int(dj)+1)
     # Rountine A is only called from CSSS Sketch
     def routine_a(self):
-        for i in range(self.rows):
-            for j in range(self.columns):
-                self.table_positive[i][j] = np.random.binomial(self.table_positive[i][j], 1/2)
-                self.table_negative[i][j] = np.random.binomial(self.table_negative[i][j], 1/2)
+        # thin every counter to Binomial(count, 1/2) in one call per table
+        self.table_positive[...] = self.rng.binomial(self.table_positive, 0.5)
+        self.table_negative[...] = self.rng.binomial(self.table_negative, 0.5)
 
     def add(self, item, weight):
         self.update(item, weight)
@@ -50,7 +53,7 @@ class CSSS_CountSketch():
         try:
             item = int(x)
         except:
-            item = int( hashlib.md5(str(hash(x.encode('utf-8'))).encode('utf-8')).hexdigest(), 16)
+            item = hash64(x)
 
         self.total_input += weight
 
@@ -69,7 +72,7 @@ class CSSS_CountSketch():
         try:
             item = int(x)
         except:
-            item = int( hashlib.md5(str(hash(x.encode('utf-8'))).encode('utf-8')).hexdigest(), 16)
+            item = hash64(x)
         ans = []
         for j in range(self.rows):
             hj = int( ( (self.a[j] * item + self.b[j]) % self.prime) % self.columns )
@@ -79,6 +82,44 @@ class CSSS_CountSketch():
 
         return statistics.median(ans)
 
+    def residues(self, keys):
+        # keys reduced mod prime as uint64, the batch counterpart of int(x) / hash64(x)
+        if isinstance(keys, np.ndarray) and keys.dtype.kind in "iu":
+            return (keys % self.prime).astype(np.uint64)
+        items = []
+        for x in keys:
+            try:
+                items.append(int(x) % self.prime)
+            except:
+                items.append(hash64(x) % self.prime)
+        return np.array(items, dtype=np.uint64)
+
+    def hash_many(self, keys):
+        # (rows, len(keys)) bucket and sign arrays; a*x + b < 2^64 since a, b, x < prime < 2^32
+        x = self.residues(keys)[None, :]
+        p = np.uint64(self.prime)
+        a, b, c, d = (np.array(v, dtype=np.uint64)[:, None] for v in (self.a, self.b, self.c, self.d))
+        h = ((a * x + b) % p % np.uint64(self.columns)).astype(np.intp)
+        g = 2 * ((c * x + d) % p % np.uint64(2)).astype(np.int64) - 1
+        return h, g
+
+    def update_many(self, keys, weights=None):
+        h, g = self.hash_many(keys)
+        if weights is None:
+            weights = np.ones(h.shape[1], dtype=np.int64)
+        else:
+            weights = np.asarray(weights, dtype=np.int64)
+        self.total_input += int(weights.sum())
+        signed = g * weights[None, :]
+        rows = np.arange(self.rows)[:, None]
+        np.add.at(self.table_positive, (rows, h), np.maximum(signed, 0))
+        np.add.at(self.table_negative, (rows, h), np.maximum(-signed, 0))
+
+    def query_many(self, keys):
+        h, g = self.hash_many(keys)
+        rows = np.arange(self.rows)[:, None]
+        return np.median(g * (self.table_positive[rows, h] - self.table_negative[rows, h]), axis=0)
+
     def inputsize(self):
         return self.total_input
 
@@ -87,7 +128,7 @@ class CSSS_CountSketch():
 
 
 class CSSS_sketch():
-    def __init__(self, epsilon=0.01, universe=2**16, k=100, alpha=2):
+    def __init__(self, epsilon=0.01, universe=2**16, k=100, alpha=2, seed=None):
         assert k>=1
         assert 0<epsilon<1
         self.alpha = alpha
@@ -100,7 +141,7 @@ class CSSS_sketch():
         self.multiple = math.ceil(math.log(self.S)) # Used to perform binomial sampling
         
         self.k = math.ceil(k) * 6
-        self.count_sketch = CSSS_CountSketch( self.d, self.k) # d x 6k 
+        self.count_sketch = CSSS_CountSketch( self.d, self.k, seed) # d x 6k 
         self.r = 1
         self.p = 0
         self.time = 0 #time <= |m|
@@ -110,21 +151,60 @@ class CSSS_sketch():
     def expo_of_two(self, x):
         return (x and (not(x & (x - 1))) )
 
+    def is_epoch(self, time):
+        # routine_a runs at times multiple * 2^j + 1
+        factor = (time -1) /self.multiple
+        return (time -1)%self.multiple == 0 and factor >= 1 and self.expo_of_two(int(factor))
+
+    def next_epoch(self, time):
+        # first epoch strictly after `time`
+        epoch = self.multiple + 1
+        while epoch <= time:
+            epoch = 2 * (epoch - 1) + 1
+        return epoch
+
     def update(self, item, weight=1):
         self.time += 1
         self.total_input += 1
         
-        factor = (self.time -1) /self.multiple
-        if (self.time -1)%self.multiple == 0 and factor >= 1 and self.expo_of_two(int(factor)) :
+        if self.is_epoch(self.time):
             self.count_sketch.routine_a()
             self.p+=1
-        rand = random.random()
+        # the count sketch's generator, the same stream update_many draws from
+        rand = self.count_sketch.rng.random()
         if rand < 2**(-1*self.p):
             #sampled
             self.samples += 1
             self.count_sketch.update(item, weight)
+    def update_many(self, keys, weights=None):
+        """
+        Batch version of `update`: the batch is cut at the routine_a epochs,
+        and each piece is sampled with one vector of uniforms and sent to
+        the count sketch in one `update_many` call.
+        """
+        keys = np.asarray(keys)
+        if weights is None:
+            weights = np.ones(len(keys), dtype=np.int64)
+        else:
+            weights = np.asarray(weights, dtype=np.int64)
+        start = 0
+        while start < len(keys):
+            time = self.time + 1
+            if self.is_epoch(time):
+                self.count_sketch.routine_a()
+                self.p+=1
+            end = min(len(keys), start + self.next_epoch(time) - time)
+            self.time += end - start
+            self.total_input += end - start
+            sampled = start + np.nonzero(self.count_sketch.rng.random(end - start) < 2**(-1*self.p))[0]
+            self.samples += len(sampled)
+            self.count_sketch.update_many(keys[sampled], weights[sampled])
+            start = end
+
     def query(self, item):
         ans = self.count_sketch.query(item)
         return ans* (2**(self.p))
+    def query_many(self, keys):
+        return self.count_sketch.query_many(keys) * (2**(self.p))
     def space(self):
         return math.floor( self.d*self.k*math.log2(self.alpha* math.log2(self.universe) / self.epsilon) )
@@ -1,167 +1,54 @@
-import hashlib
-import random
-from spacesaving import SpaceSaving
-
-def md5_32bit(s):
-    md5_digest = hashlib.md5(s).digest()  # 16-byte (128-bit) digest
-    return int.from_bytes(md5_digest[:4], byteorder='little') & 0xffffffff
+import math
+import numpy as np
+from rng import BufferedRandom
+from spacesaving import SpaceSaving, CountIndex
+from hashing import hash64, indices, fingerprint, hash64_many, indices_many, fingerprint_many
 
 class ssummary:
     """
-    Python translation of the C++ ssummary class, using hashlib.md5
-    see https://github.com/papergitkeeper/heavy-keeper-project/blob/master/ssummary.h
+    Stream-summary top-k store, after the C++ ssummary class of
+    https://github.com/papergitkeeper/heavy-keeper-project/blob/master/ssummary.h
+    Tracked flows are grouped into buckets of equal count and the buckets form
+    a doubly linked list in increasing count order (spacesaving.CountIndex),
+    so a unit increment, the min lookup and the min replacement are O(1), and
+    a weighted update only walks over the counts it skips. Same interface as
+    heavykeeper_minheap.
     """
-    def __init__(self, K, N=1000, M=1000, LEN2=1000):
-        # maximum flow
-        # M is maximum size of stream-summary
-        self.K = K
-        self.N = N
-        self.M = M
-        self.LEN2 = LEN2
-
-        self.sum  = [0] * (self.M + 10)
-        self.last = [0] * (self.M + 10)
-        self.Next = [0] * (self.M + 10)
-        self.ID   = [0] * (self.M + 10)
-
-        self.strs = ["" for _ in range(self.M + 10)]
-
-        self.Next2 = [0] * (self.M + 10)
-        self.head2 = [0] * (self.LEN2 + 10)
-
-        self.head = [0] * (self.N + 10)
-        self.Left = [0] * (self.N + 10)
-        self.Right= [0] * (self.N + 10)
-
-        self.tot = 0
-        for i in range(1, M+2):
-            self.ID[i]=i
-        self.num = self.M+2
-        self.Right[0] = N
-        self.Left[N]=0
-
-    def space(self):
-        return self.M*6 + self.N*3 + self.LEN2
+    def __init__(self, k):
+        self.k = k
+        self.index = CountIndex()
 
-    def location(self, ST):
-        data = ST.encode('utf-8')
-        return md5_32bit(data) % self.LEN2
-    
-    def getid(self):
-        n = self.num
-        self.num -= 1
-        i = self.ID[n]
-        self.last[i] = 0
-        self.Next[i] = 0
-        self.sum[i] = 0
-        self.Next2[i] = 0
-        return i;
-
-    def add2(self, x, y):
-        """
-        C++:
-            Next2[y] = head2[x];
-            head2[x] = y;
-        """
-        self.Next2[y] = self.head2[x]
-        self.head2[x] = y
+    def isFull(self):
+        return self.k == len(self.index)
 
-    def find(self, s):
-        """
-        C++:
-            for(int i = head2[location(s)]; i; i = Next2[i])
-                if(str[i] == s) return i;
-            return 0;
-        """
-        loc = self.location(s)
-        i = self.head2[loc]
-        while i != 0:
-            if self.strs[i] == s:
-                return i
-            i = self.Next2[i]
+    def query(self, item):
+        if item in self.index:
+            return self.index.count(item)
         return 0
 
-    def linkhead(self, i, j):
-        """
-        C++:
-            Left[i] = j;
-            Right[i] = Right[j];
-            Right[j] = i;
-            Left[Right[i]] = i;
-        """
-        self.Left[i] = j
-        self.Right[i] = self.Right[j]
-        self.Right[j] = i
-        self.Left[self.Right[i]] = i
-
-    def cuthead(self, i):
-        """
-        C++:
-            int t1 = Left[i], t2 = Right[i];
-            Right[t1] = t2;
-            Left[t2] = t1;
-        """
-        t1 = self.Left[i]
-        t2 = self.Right[i]
-        self.Right[t1] = t2
-        self.Left[t2] = t1
+    def find(self, x):
+        return x in self.index
 
     def getmin(self):
-        if self.tot < self.K:
+        if not self.index:
             return 0
-        if self.Right[0] == self.N:
-            return 1
-        return self.Right[0]
-
-    def link(self, i, ww):
-        self.tot += 1
-        s = self.sum[i]
-        flag = (self.head[s] == 0)
-
-        self.Next[i] = self.head[s]
-        if self.Next[i] != 0:
-            self.last[self.Next[i]] = i
-        self.last[i] = 0
-        self.head[s] = i
-
-        if flag:
-            j = s - 1
-            while j > 0 and j > s - 10:
-                if self.head[j] != 0:
-                    self.linkhead(s, j)
-                    return
-                j -= 1
-            self.linkhead(s, ww)
-
-    def cut(self, i):
-        self.tot -= 1
-        s = self.sum[i]
-        if self.head[s] == i:
-            self.head[s] = self.Next[i]
-        if self.head[s] == 0:
-            self.cuthead(s)
-        t1 = self.last[i]
-        t2 = self.Next[i]
-        if t1 != 0:
-            self.Next[t1] = t2
-        if t2 != 0:
-            self.last[t2] = t1
-
-    def recycling(self, i):
-        w = self.location(self.strs[i])
-        if self.head2[w] == i:
-            self.head2[w] = self.Next2[i]
+        return self.index.getmin()
+
+    def items(self):
+        return self.index.ascending()
+
+    def update(self, item, weight):
+        if item in self.index:
+            self.index.set(item, self.index.count(item) + weight)
         else:
-            j = self.head2[w]
-            while j != 0:
-                if self.Next2[j] == i:
-                    self.Next2[j] = self.Next2[i]
-                    break
-                j = self.Next2[j]
+            if len(self.index) < self.k:
+                self.index.set(item, weight)
+            else:
+                assert False
 
-        self.num += 1
-        if self.num < len(self.ID):
-            self.ID[self.num] = i   
+    def replace_min(self, item, weight):
+        self.index.popmin()
+        self.index.set(item, weight)
 
 class heavykeeper_minheap:
     def __init__(self, k):
@@ -201,6 +88,10 @@ class heavykeeper_minheap:
     def find(self, x):
         return x in self.pos
 
+    def items(self):
+        for item, weight in self.heap:
+            yield item, weight
+
     def replace_min(self, item, weight):
         old_item = self.heap[0][0]
         del self.pos[old_item]
@@ -251,10 +142,12 @@ class HeavyKeeper:
     Python implementation of the HeavyKeeper algorithm,
     check https://github.com/papergitkeeper/heavy-keeper-project/blob/master/heavykeeper.h
     and https://github.com/migotom/heavykeeper/blob/master/bin/topk-hk/main.go
+    `summary` selects the top-k store, heavykeeper_minheap or ssummary.
     """
 
-    def __init__(self, M2, k):
-        random.seed(0)
+    def __init__(self, M2, k, seed=0, summary=heavykeeper_minheap):
+        self.seed = seed
+        self.rng = BufferedRandom(seed) # own uniforms for the decay
 
         self.HK_b = 1.08
         self.K = k
@@ -262,12 +155,30 @@ class HeavyKeeper:
         self.depth = 5
         self.width = int(M2//self.depth)
 
-        self.buckets = [
-            [{"key": None, "count": 0} for _ in range(self.width)]
-            for _ in range(self.depth)
-        ]
-        # self.min_heap = ssummary(self.K, self.K, self.K, self.K)
-        self.min_heap = heavykeeper_minheap(self.K)
+        # 16 bit fingerprint + 32 bit counter per bucket, fingerprint 0 marks an empty
+        # bucket (_hash maps a key's fingerprint 0 to 1)
+        self.fingerprints = np.zeros((self.depth, self.width), dtype=np.uint16)
+        self.counts = np.zeros((self.depth, self.width), dtype=np.uint32)
+        self.derive()
+        self.min_heap = summary(self.K)
+
+    def derive(self):
+        # decay probability HK_b^-count, 0 once it drops below the resolution of the uniforms
+        self.decay = [self.HK_b ** (-1*c) for c in range(int(53 * math.log(2) / math.log(self.HK_b)) + 1)]
+        # flat memoryviews of the bucket arrays, cheaper than numpy indexing for scalar access
+        self.fp_view = memoryview(self.fingerprints.reshape(-1))
+        self.count_view = memoryview(self.counts.reshape(-1))
+        self.row_offsets = [row * self.width for row in range(self.depth)]
+
+    def __getstate__(self):
+        # memoryviews cannot be pickled or copied, derive them again
+        state = self.__dict__.copy()
+        del state["fp_view"], state["count_view"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.derive()
 
     def space(self):
         # 16 bits fp + counter for each bucket
@@ -275,38 +186,65 @@ class HeavyKeeper:
         return self.width*self.depth*1.5 + self.K
 
     def _hash(self, x):
-        initial_data = str(hash(x)).encode('utf-8')
-        for i in range(self.depth):
-            md5_obj = hashlib.md5(initial_data)
-            md5_obj.update(str(i).encode('utf-8'))
-            full_digest = md5_obj.digest()
-            bucket_idx = int(md5_obj.hexdigest(), 16) % self.width
-            fp_16 = int.from_bytes(full_digest[-2:], byteorder='little')
-            yield (bucket_idx, fp_16)
+        # one base hash gives every row's bucket and the 16 bit fingerprint
+        h = hash64(x, self.seed)
+        slots = [offset + i for offset, i in zip(self.row_offsets, indices(h, self.depth, self.width))]
+        return slots, fingerprint(h) or 1
+
+    def _hash_many(self, keys):
+        if not isinstance(keys, np.ndarray) and keys and isinstance(keys[0], int):
+            keys = np.asarray(keys, dtype=np.int64)
+        h = hash64_many(keys, self.seed)
+        slots = indices_many(h, self.depth, self.width) + np.array(self.row_offsets)[:, None]
+        fps = fingerprint_many(h)
+        fps[fps == 0] = 1 # as in _hash, 0 is the empty bucket
+        return slots.T.tolist(), fps.tolist()
 
     def update(self, item, increment=1):
-        item = str(item)
+        slots, fp = self._hash(item)
+        self.update_slots(item, slots, fp, increment)
+
+    def update_many(self, keys, weights=None):
+        """
+        Apply a batch of updates in order. All keys are hashed at once, the
+        bucket logic then runs per key on the precomputed slots.
+        """
+        slots, fps = self._hash_many(keys)
+        if isinstance(keys, np.ndarray):
+            keys = keys.tolist()
+        if weights is None:
+            weights = [1] * len(keys)
+        elif isinstance(weights, np.ndarray):
+            weights = weights.tolist()
+        for item, item_slots, fp, increment in zip(keys, slots, fps, weights):
+            self.update_slots(item, item_slots, fp, increment)
+
+    def update_slots(self, item, slots, fp, increment):
         in_min_heap = self.min_heap.find(item)
+        heap_min = self.min_heap.getmin()
+        fps = self.fp_view
+        counts = self.count_view
+        random = self.rng.random
         maxv = 0
 
-        for row_idx, (bucket_idx, fingerprint) in enumerate(self._hash(item)):
-            # print(item, bucket_idx, fingerprint)
-            bucket = self.buckets[row_idx][bucket_idx]
-
-            if bucket["key"] == fingerprint:
-                if in_min_heap or (bucket["count"]<=self.min_heap.getmin() and increment > 0) or (bucket["count"] > 0 and increment < 0):
-                    bucket["count"] += increment
-                maxv = max(maxv, bucket["count"])
+        for slot in slots:
+            count = counts[slot]
+            if fps[slot] == fp:
+                if in_min_heap or (count<=heap_min and increment > 0) or (count > 0 and increment < 0):
+                    count = max(count + increment, 0)
+                    counts[slot] = count
+                maxv = max(maxv, count)
             else:
                 # decay
                 if increment > 0:
-                    decay_prob = self.HK_b ** (-1*bucket["count"])
-                    if random.random() < decay_prob:
-                        bucket["count"] -= increment
-                        if bucket["count"] < 0:
-                            bucket["key"] = fingerprint
-                            bucket["count"] = 0
-                        maxv = max(maxv, bucket["count"])
+                    decay_prob = self.decay[count] if count < len(self.decay) else 0.0
+                    if random() < decay_prob:
+                        count -= increment
+                        if count < 0:
+                            fps[slot] = fp
+                            count = 0
+                        counts[slot] = count
+                        maxv = max(maxv, count)
         if not in_min_heap:
             if self.min_heap.isFull() == False:
                 if maxv > 0:
@@ -318,23 +256,24 @@ class HeavyKeeper:
 
 
     def query(self, item):
-        item = str(item)
-
         in_min_heap =self.min_heap.find(item)
         est_count = 0
         if in_min_heap:
             est_count = self.min_heap.query(item)
         else:
-            for row_idx, (bucket_idx, fingerprint) in enumerate(self._hash(item)):
-                bucket = self.buckets[row_idx][bucket_idx]
-                if bucket["key"] == fingerprint:
-                    est_count = max(bucket["count"], est_count)
+            slots, fp = self._hash(item)
+            for slot in slots:
+                if self.fp_view[slot] == fp:
+                    est_count = max(self.count_view[slot], est_count)
         return est_count
 
 
 if __name__ == "__main__":
+    import sys
+    import time
+
     # Example usage
-    hk = HeavyKeeper(2,2)
+    hk = HeavyKeeper(10,2)
     print(hk.space())
 
     data_stream = [
@@ -361,3 +300,15 @@ if __name__ == "__main__":
     print("Estimated count for 'cherry':  ", hk.query("cherry"))
     print("Estimated count for 'durian':  ", hk.query("durian"))
     print("Estimated count for 'eggplant':", hk.query("eggplant"))
+    print('-------')
+
+    # Compare the two top-k backends on a skewed stream
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10**5
+    stream = np.random.default_rng(0).zipf(1.1, n) % 2**20
+    for summary in (heavykeeper_minheap, ssummary):
+        hk = HeavyKeeper(4000, 200, summary=summary)
+        start = time.perf_counter()
+        hk.update_many(stream)
+        elapsed = time.perf_counter() - start
+        top = sorted(hk.min_heap.items(), key=lambda entry: -entry[1])[:5]
+        print("%-20s %8.0f updates/s  top-5: %s" % (summary.__name__, n / elapsed, top))
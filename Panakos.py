@@ -3,7 +3,7 @@ from githubCountMin import CountMinSketch
 import math
 import collections
 from collections import defaultdict
-import hashlib
+from hashing import hash64, indices, fingerprint, hash64_many, indices_many, fingerprint_many
 import copy
 from statistics import mean
 import numpy as np
@@ -11,48 +11,94 @@ import numpy as np
 
 
 class Panakos():
-    def __init__(self, memory_budget, T = 16):
+    def __init__(self, memory_budget, T = 16, seed=0):
         bitVectorLength = int(memory_budget * 0.35 * 32 / 2)
         self.bitmapLen = int(bitVectorLength)
-        self.bitmap = np.zeros(self.bitmapLen, dtype=bool)
-        self.bitmap_morethanonce = np.zeros(self.bitmapLen, dtype=bool)
+        # both bitmaps are bit-packed, bit i lives in byte i >> 3
+        self.bitmap = np.zeros((self.bitmapLen + 7) // 8, dtype=np.uint8)
+        self.bitmap_morethanonce = np.zeros((self.bitmapLen + 7) // 8, dtype=np.uint8)
 
         self.countMinColumns =  int(memory_budget * 0.15 * 32 / 4)
         self.countMinRows = 2
-        self.CountMin = CountMinSketch(self.countMinColumns, self.countMinRows)
+        self.CountMin = CountMinSketch(self.countMinColumns, self.countMinRows, seed)
         self.T = T
+        self.seed = seed
         self.SpaceSaving = SpaceSaving(int(memory_budget * 0.5 / 3)) # spacesaving uses 3 counters (item, insert count, delete count)
-    
+        self.derive()
+
+    def derive(self):
+        # byte views of the bitmaps for scalar access
+        self.bitmap_view = memoryview(self.bitmap)
+        self.morethanonce_view = memoryview(self.bitmap_morethanonce)
+
+    def __getstate__(self):
+        # memoryviews cannot be pickled or copied, derive them again
+        state = self.__dict__.copy()
+        del state["bitmap_view"], state["morethanonce_view"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.derive()
+
     def _hash(self, x):
-        md5 = hashlib.md5(str(hash(x)).encode('utf-8'))
-        return int(md5.hexdigest(), 16) % self.bitmapLen
+        # one hash of x gives the bit position and the CountMin row indices
+        h = hash64(x, self.seed)
+        return fingerprint(h, 64) % self.bitmapLen, indices(h, self.countMinRows, self.CountMin.m)
+
+    def _hash_many(self, keys):
+        if not isinstance(keys, np.ndarray) and keys and isinstance(keys[0], int):
+            keys = np.asarray(keys, dtype=np.int64)
+        h = hash64_many(keys, self.seed)
+        bits = (fingerprint_many(h, 64) % np.uint64(self.bitmapLen)).astype(np.intp)
+        return bits, indices_many(h, self.countMinRows, self.CountMin.m)
 
     def update(self, x, weight=1):
+        bit_position, idx = self._hash(x)
+        self.update_hashed(x, bit_position, idx, weight)
+
+    def update_many(self, keys, weights=None):
+        """
+        Apply a batch of updates in order, hashing all keys at once.
+        """
+        bits, idx = self._hash_many(keys)
+        if isinstance(keys, np.ndarray):
+            keys = keys.tolist()
+        if weights is None:
+            weights = [1] * len(keys)
+        elif isinstance(weights, np.ndarray):
+            weights = weights.tolist()
+        for x, bit_position, row_idx, weight in zip(keys, bits.tolist(), idx.T.tolist(), weights):
+            self.update_hashed(x, bit_position, row_idx, weight)
+
+    def update_hashed(self, x, bit_position, idx, weight):
+        byte, mask = bit_position >> 3, 1 << (bit_position & 7)
+        bitmap = self.bitmap_view
+        morethanonce = self.morethanonce_view
         if weight > 0:
-            bit_position = self._hash(x)
-            if self.bitmap[bit_position] == False:
-                self.bitmap[bit_position] = True
-                self.bitmap_morethanonce[bit_position] = False
+            if not bitmap[byte] & mask:
+                bitmap[byte] |= mask
+                morethanonce[byte] &= ~mask
                 return
-            if self.CountMin.query(x) < self.T-1: # 4 bit so 0 - 15
-                self.bitmap_morethanonce[bit_position] = True
-                self.CountMin.add(x, weight)
+            if self.CountMin.query_at(idx) < self.T-1: # 4 bit so 0 - 15
+                morethanonce[byte] |= mask
+                self.CountMin.add_at(idx, weight)
                 return
             self.SpaceSaving.update(x, weight)
         else:
             if self.SpaceSaving.find(x): # monitored
                 self.SpaceSaving.update(x, weight)
                 return
-            bit_position = self._hash(x)
-            if self.bitmap[bit_position] == True and self.bitmap_morethanonce[bit_position] == False:
-                self.bitmap[bit_position] = False
+            if bitmap[byte] & mask and not morethanonce[byte] & mask:
+                bitmap[byte] &= ~mask
                 return
-            if self.bitmap_morethanonce[bit_position] == True and self.CountMin.query(x) > 0:
-                self.CountMin.add(x, weight)
+            count = self.CountMin.query_at(idx)
+            if morethanonce[byte] & mask and count > 0:
+                self.CountMin.add_at(idx, weight)
                 return
-            if self.CountMin.query(x) == 0:
-                self.bitmap_morethanonce[bit_position] = False
-            self.bitmap[bit_position] = False
+            if count == 0:
+                morethanonce[byte] &= ~mask
+            bitmap[byte] &= ~mask
         return
     def query(self, x):
         """
@@ -60,10 +106,28 @@ class Panakos():
         """
         if self.SpaceSaving.find(x):
             return self.SpaceSaving.query(x) + self.T
-        bit_position = self._hash(x)
-        if self.bitmap[bit_position] == False and self.bitmap_morethanonce[bit_position] == False:
+        bit_position, idx = self._hash(x)
+        byte, mask = bit_position >> 3, 1 << (bit_position & 7)
+        bit = 1 if self.bitmap_view[byte] & mask else 0
+        morethanonce = self.morethanonce_view[byte] & mask
+        if not bit and not morethanonce:
             return 0
-        if self.bitmap[bit_position] == True and self.bitmap_morethanonce[bit_position] == False:
+        if bit and not morethanonce:
             return 1
-        return self.CountMin.query(x) + int(self.bitmap[bit_position])
-    
\ No newline at end of file
+        return self.CountMin.query_at(idx) + bit
+
+    def query_many(self, keys):
+        """
+        Estimate a batch of keys, with the bitmap tests and the CountMin
+        lookups done on whole arrays.
+        """
+        bits, idx = self._hash_many(keys)
+        byte, shift = bits >> 3, (bits & 7).astype(np.uint8)
+        bit = ((self.bitmap[byte] >> shift) & 1).astype(np.int64)
+        morethanonce = ((self.bitmap_morethanonce[byte] >> shift) & 1).astype(bool)
+        counts = np.min([np.frombuffer(table, dtype=np.int32)[row] for table, row in zip(self.CountMin.tables, idx)], axis=0)
+        est = np.where(morethanonce, counts + bit, bit)
+        monitored = [i for i, x in enumerate(keys) if self.SpaceSaving.find(x)]
+        for i in monitored:
+            est[i] = self.SpaceSaving.query(keys[i]) + self.T
+        return est
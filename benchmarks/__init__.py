@@ -0,0 +1,16 @@
+"""
+Reproducible benchmarks for every sketch in the repo.
+
+    python -m benchmarks run --n 100000 --out results.json
+    python -m benchmarks compare baseline.json results.json
+    python -m benchmarks sweep --eps 0.0039 --eps 0.00049 --ratio 0.25 --ratio 0.5 --out sweep.csv
+
+`run` ingests seeded synthetic streams and records throughput, per-update
+and per-query latency percentiles and peak memory (tracemalloc) per sketch
+as JSON; `compare` flags regressions between two such files. `sweep` runs
+a (sketch, eps, deletion ratio, seed) grid on a process pool, with each
+stream in shared memory, and writes accuracy and timing as one CSV table.
+"""
+from benchmarks.streams import zipf_stream, bounded_deletion_stream
+from benchmarks.runner import SKETCHES, run, compare
+from benchmarks.sweep import sweep, write_table
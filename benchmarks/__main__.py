@@ -0,0 +1,90 @@
+import argparse
+import json
+import sys
+
+from benchmarks.runner import SKETCHES, run, compare
+from benchmarks.sweep import EPSILONS, sweep, write_table
+
+
+def log(result):
+    print("%-30s %-17s %10.0f upd/s  update p50 %7.0f ns  p99 %8.0f ns  query p50 %7.0f ns  peak %s" % (
+        result["sketch"], result["stream"], result["throughput"],
+        result["update_ns"]["p50"], result["update_ns"]["p99"], result["query_ns"]["p50"],
+        "%.0f KiB" % (result["peak_bytes"] / 1024) if "peak_bytes" in result else "-",
+    ), file=sys.stderr)
+
+def log_row(row):
+    print("%-30s eps %-10g ratio %-5g seed %-3d %10.0f upd/s  ARE %8.4f  F1 %.3f  %.0f KiB" % (
+        row["sketch"], row["eps"], row["ratio"], row["seed"], row["throughput"],
+        row["are"], row["f1"], row["bytes"] / 1024,
+    ), file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="benchmark the sketches and write JSON")
+    p.add_argument("--n", type=int, default=10**5, help="insertions per stream")
+    p.add_argument("--eps", type=float, default=2**-8)
+    p.add_argument("--ratio", type=float, default=0.5, help="deletions / insertions")
+    p.add_argument("--skew", type=float, default=1.1)
+    p.add_argument("--universe", type=int, default=2**21)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--queries", type=int, default=1000)
+    p.add_argument("--sketch", action="append", choices=list(SKETCHES), help="repeat to select several (default: all)")
+    p.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    p.add_argument("--out", help="output file (default: stdout)")
+
+    w = sub.add_parser("sweep", help="accuracy and timing over a parameter grid on a process pool, as CSV")
+    w.add_argument("--n", type=int, default=10**5, help="insertions per stream")
+    w.add_argument("--eps", type=float, action="append", help="repeat to select several (default: 2^-8 .. 2^-11)")
+    w.add_argument("--ratio", type=float, action="append", help="deletions / insertions, repeat to select several (default: 0.5)")
+    w.add_argument("--seed", type=int, action="append", help="stream seed, repeat to select several (default: 0)")
+    w.add_argument("--skew", type=float, default=1.1)
+    w.add_argument("--universe", type=int, default=2**21)
+    w.add_argument("--k", type=int, default=10, help="top-k size for precision, recall and F1")
+    w.add_argument("--sketch", action="append", choices=list(SKETCHES), help="repeat to select several (default: all but the /batch entries)")
+    w.add_argument("--processes", type=int, help="pool size (default: one per core)")
+    w.add_argument("--out", help="output file (default: stdout)")
+
+    c = sub.add_parser("compare", help="flag regressions between two runs")
+    c.add_argument("baseline")
+    c.add_argument("current")
+    c.add_argument("--threshold", type=float, default=0.1, help="relative change that counts as a regression")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        results = run(args.n, args.eps, args.ratio, args.skew, args.universe, args.seed,
+                      args.sketch, args.queries, not args.no_memory, log)
+        text = json.dumps(results, indent=2)
+        if args.out:
+            with open(args.out, "w") as f:
+                f.write(text)
+        else:
+            print(text)
+        return 0
+
+    if args.command == "sweep":
+        rows = sweep(args.sketch, args.eps or EPSILONS, args.ratio or (0.5,), args.seed or (0,), args.n,
+                     args.skew, args.universe, args.k, args.processes, log=log_row)
+        if args.out:
+            with open(args.out, "w", newline="") as f:
+                write_table(rows, f)
+        else:
+            write_table(rows, sys.stdout)
+        return 0
+
+    with open(args.baseline) as f:
+        old = json.load(f)
+    with open(args.current) as f:
+        new = json.load(f)
+    regressions = compare(old, new, args.threshold)
+    for line in regressions:
+        print("REGRESSION", line)
+    if not regressions:
+        print("no regressions above %.0f%%" % (100 * args.threshold))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
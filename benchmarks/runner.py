@@ -0,0 +1,201 @@
+import platform
+import random
+import time
+import tracemalloc
+import numpy as np
+
+from spacesaving import SpaceSaving, IntSpaceSaving, StreamSummary, DoubleSpaceSaving
+from unbiasedSpaceSaving import UnbiasedDSS
+from githubCountMin import CountMinSketch, VectorizedCountMinSketch
+from CSSS import CSSS_CountSketch
+from Panakos import Panakos
+from HeavyKeeper import HeavyKeeper
+from sharded import apply_batch
+from benchmarks.streams import zipf_stream, bounded_deletion_stream
+
+BATCH = 1024 # events per call of the batch paths
+PERCENTILES = (50, 90, 99, 99.9)
+# metric -> True if larger is better
+METRICS = {
+    "throughput": True,
+    "update_ns.p50": False,
+    "update_ns.p99": False,
+    "query_ns.p50": False,
+    "query_ns.p99": False,
+    "peak_bytes": False,
+}
+
+
+def budget(eps):
+    # every sketch gets the counters of a 16 row CountMinSketch, as in Evaluation.ipynb
+    return int(1/eps) * 16
+
+def signed_update(sketch, x, w):
+    sketch.update(x, w)
+
+def signed_add(sketch, x, w):
+    sketch.add(x, w)
+
+def split_update(sketch, x, w):
+    # DoubleSpaceSaving style: positive weight plus an insert flag
+    sketch.update(x, abs(w), w > 0)
+
+def single_query(sketch, x):
+    return sketch.query(x)
+
+def batch_update(sketch, keys, weights):
+    # update_many or add_many, whichever the sketch has
+    apply_batch(sketch, keys, weights)
+
+def batch_query(sketch, keys):
+    return sketch.query_many(keys)
+
+# update and query functions that take BATCH events per call
+BATCHED = {batch_update, batch_query}
+
+# name -> (constructor from eps, update, query); the "/batch" entries time
+# the batch paths on the same constructors
+SKETCHES = {
+    "SpaceSaving": (lambda eps: SpaceSaving(budget(eps)//3), signed_update, single_query),
+    "IntSpaceSaving": (lambda eps: IntSpaceSaving(budget(eps)//3), signed_update, single_query),
+    "StreamSummary": (lambda eps: StreamSummary(budget(eps)//3), signed_update, single_query),
+    "DoubleSpaceSaving": (lambda eps: DoubleSpaceSaving(eps, budget(eps)//2), split_update, single_query),
+    "UnbiasedDSS": (lambda eps: UnbiasedDSS(eps, budget(eps)//2), split_update, single_query),
+    "CountMinSketch": (lambda eps: CountMinSketch(int(1/eps), 16), signed_add, single_query),
+    "CSSS_CountSketch": (lambda eps: CSSS_CountSketch(16, int(1/eps), seed=0), signed_add, single_query),
+    "Panakos": (lambda eps: Panakos(budget(eps)), signed_update, single_query),
+    "HeavyKeeper": (lambda eps: HeavyKeeper((budget(eps)-400)//1.5, 200), signed_update, single_query),
+    "SpaceSaving/batch": (lambda eps: SpaceSaving(budget(eps)//3), batch_update, single_query),
+    "IntSpaceSaving/batch": (lambda eps: IntSpaceSaving(budget(eps)//3), batch_update, batch_query),
+    "StreamSummary/batch": (lambda eps: StreamSummary(budget(eps)//3), batch_update, single_query),
+    "DoubleSpaceSaving/batch": (lambda eps: DoubleSpaceSaving(eps, budget(eps)//2), batch_update, single_query),
+    "UnbiasedDSS/batch": (lambda eps: UnbiasedDSS(eps, budget(eps)//2), batch_update, single_query),
+    "VectorizedCountMinSketch/batch": (lambda eps: VectorizedCountMinSketch(int(1/eps), 16), batch_update, batch_query),
+    "CSSS_CountSketch/batch": (lambda eps: CSSS_CountSketch(16, int(1/eps), seed=0), batch_update, batch_query),
+    "Panakos/batch": (lambda eps: Panakos(budget(eps)), batch_update, batch_query),
+    "HeavyKeeper/batch": (lambda eps: HeavyKeeper((budget(eps)-400)//1.5, 200), batch_update, single_query),
+}
+
+
+def percentiles(ns):
+    values = np.percentile(ns, PERCENTILES)
+    return {"p%g" % p: float(v) for p, v in zip(PERCENTILES, values)}
+
+def calls(fn, *columns):
+    # the arguments of each call of fn: one event, or BATCH events as int64 arrays
+    if fn not in BATCHED:
+        return list(zip(*columns))
+    return [tuple(np.asarray(c[i:i + BATCH], dtype=np.int64) for c in columns) for i in range(0, len(columns[0]), BATCH)]
+
+def timed(sketch, fn, args):
+    # ns per event, a batch call is spread evenly over its events
+    clock = time.perf_counter_ns
+    latencies = [0] * len(args)
+    for i, a in enumerate(args):
+        start = clock()
+        fn(sketch, *a)
+        latencies[i] = clock() - start
+    if fn not in BATCHED:
+        return np.array(latencies, dtype=np.int64)
+    sizes = [len(a[0]) for a in args]
+    return np.repeat(np.array(latencies, dtype=np.float64) / sizes, sizes)
+
+def timed_updates(sketch, update, keys, weights):
+    return timed(sketch, update, calls(update, keys, weights))
+
+def timed_queries(sketch, query, keys):
+    return timed(sketch, query, calls(query, keys))
+
+def peak_memory(make, update, keys, weights):
+    # separate pass, tracemalloc slows everything down
+    args = calls(update, keys, weights)
+    random.seed(0)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        sketch = make()
+        for a in args:
+            update(sketch, *a)
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+def bench(name, eps, stream, keys, weights, queries, memory=True):
+    make, update, query = SKETCHES[name]
+    random.seed(0)
+    sketch = make(eps)
+    update_ns = timed_updates(sketch, update, keys, weights)
+    query_ns = timed_queries(sketch, query, queries)
+    result = {
+        "sketch": name,
+        "stream": stream,
+        "updates": len(keys),
+        "throughput": len(keys) / (update_ns.sum() / 1e9),
+        "update_ns": percentiles(update_ns),
+        "query_ns": percentiles(query_ns),
+    }
+    if memory:
+        result["peak_bytes"] = peak_memory(lambda: make(eps), update, keys, weights)
+    return result
+
+def run(n=10**5, eps=2**-8, ratio=0.5, skew=1.1, universe=2**21, seed=0, sketches=None, queries=1000, memory=True, log=None):
+    """
+    Benchmark `sketches` (default: all of SKETCHES) on an insert-only Zipf
+    stream and a bounded-deletion stream of n insertions, and return the
+    results as a JSON-ready dict.
+    """
+    sketches = list(SKETCHES) if sketches is None else sketches
+    inserts = zipf_stream(n, skew, universe, seed)
+    streams = {
+        "zipf": (inserts, np.ones(n, dtype=np.int64)),
+        "bounded_deletion": bounded_deletion_stream(n, ratio, skew, universe, seed),
+    }
+    rng = np.random.default_rng(seed)
+    query_keys = rng.choice(inserts, size=min(queries, n), replace=False).tolist()
+    results = []
+    for stream, (keys, weights) in streams.items():
+        keys, weights = keys.tolist(), weights.tolist()
+        for name in sketches:
+            result = bench(name, eps, stream, keys, weights, query_keys, memory)
+            if log is not None:
+                log(result)
+            results.append(result)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "params": {"n": n, "eps": eps, "ratio": ratio, "skew": skew, "universe": universe, "seed": seed, "queries": queries},
+        },
+        "results": results,
+    }
+
+
+def metric(result, name):
+    value = result
+    for part in name.split("."):
+        if value is None or part not in value:
+            return None
+        value = value[part]
+    return value
+
+def compare(old, new, threshold=0.1):
+    """
+    Compare two `run` outputs and return one line per metric that got worse
+    by more than `threshold` (relative) for the same sketch and stream.
+    """
+    before = {(r["sketch"], r["stream"]): r for r in old["results"]}
+    regressions = []
+    for result in new["results"]:
+        key = (result["sketch"], result["stream"])
+        if key not in before:
+            continue
+        for name, higher_is_better in METRICS.items():
+            a, b = metric(before[key], name), metric(result, name)
+            if not a or b is None:
+                continue
+            change = (b - a) / a
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append("%s/%s %s: %.4g -> %.4g (%+.1f%%)" % (key[0], key[1], name, a, b, 100 * change))
+    return regressions
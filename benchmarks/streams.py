@@ -0,0 +1,32 @@
+import numpy as np
+
+
+def zipf_stream(n, skew=1.1, universe=2**21, seed=0):
+    """
+    n insertions drawn from a Zipf(skew) distribution over [1, universe].
+    """
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, universe + 1, dtype=np.float64)
+    p = ranks ** -skew
+    p /= p.sum()
+    # relabel the ranks so heavy keys are not simply the small integers
+    labels = rng.permutation(universe).astype(np.int64) + 1
+    return labels[rng.choice(universe, size=n, p=p)]
+
+def bounded_deletion_stream(n, ratio=0.5, skew=1.1, universe=2**21, seed=0):
+    """
+    A bounded-deletion stream of n insertions followed, at random later
+    positions, by deletions of ratio * n of them, so D <= (1 - 1/alpha) I
+    holds with alpha = 1 / (1 - ratio). Returns (keys, weights) with weights
+    +1 for insertions and -1 for deletions.
+    """
+    rng = np.random.default_rng(seed)
+    inserts = zipf_stream(n, skew, universe, seed)
+    deleted = rng.choice(n, size=int(ratio * n), replace=False)
+    # each deletion is placed at a uniform time after the insertion it undoes
+    delete_times = deleted + 0.5 + rng.random(len(deleted)) * (n - deleted)
+    times = np.concatenate([np.arange(n, dtype=np.float64), delete_times])
+    keys = np.concatenate([inserts, inserts[deleted]])
+    weights = np.concatenate([np.ones(n, dtype=np.int64), -np.ones(len(deleted), dtype=np.int64)])
+    order = np.argsort(times, kind="stable")
+    return keys[order], weights[order]
@@ -0,0 +1,139 @@
+"""
+Parameter sweeps over the SKETCHES of benchmarks.runner on a process pool.
+
+Every (deletion ratio, seed) stream is generated once into shared memory;
+pool workers attach to the segments by name, so the grid of (sketch, eps,
+ratio, seed) configurations is fanned out without copying any stream. Each
+configuration ingests its stream in chunks through sharded.apply_batch and
+becomes one row of the table: accuracy from evaluation.evaluate, update
+time and throughput, and resident bytes from memory.usage. Timings are per
+worker, with the other workers running.
+"""
+import csv
+import multiprocessing as mp
+import random
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+from benchmarks.runner import SKETCHES, BATCHED
+from benchmarks.streams import bounded_deletion_stream
+from evaluation import ExactCounts, evaluate
+from memory import usage
+from readers import CHUNK
+from sharded import apply_batch, attach_shared
+
+EPSILONS = (2**-8, 2**-9, 2**-10, 2**-11) # as in Evaluation.ipynb
+COLUMNS = ("sketch", "eps", "ratio", "seed", "events", "update_seconds", "throughput", "bytes",
+           "are", "max_error", "precision", "recall", "f1")
+
+
+class SharedStream():
+    """
+    keys and weights of a stream as one (2, n) int64 array in shared memory.
+    Pickles as the segment name, the creating process owns the segment.
+    """
+    def __init__(self, keys, weights):
+        self.n = len(keys)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, 16 * self.n))
+        self.attach()
+        self.events[0] = keys
+        self.events[1] = weights
+
+    def attach(self):
+        self.events = np.ndarray((2, self.n), dtype=np.int64, buffer=self.shm.buf)
+        self.keys, self.weights = self.events
+
+    def __getstate__(self):
+        return self.shm.name, self.n
+
+    def __setstate__(self, state):
+        name, self.n = state
+        self.shm = attach_shared(name)
+        self.attach()
+
+    def close(self, unlink=False):
+        del self.events, self.keys, self.weights
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+# --- worker side ---
+
+WORKER = {} # per process: shared streams, exact counts, k, chunk
+
+def init_worker(streams, universe, k, chunk):
+    WORKER.update(streams=streams, universe=universe, k=k, chunk=chunk, exact={})
+
+def exact_counts(stream_key):
+    # one ExactCounts per stream and process, built on first use
+    exact = WORKER["exact"]
+    if stream_key not in exact:
+        stream = WORKER["streams"][stream_key]
+        exact[stream_key] = ExactCounts(WORKER["universe"] + 1)
+        exact[stream_key].update_many(stream.keys, stream.weights)
+    return exact[stream_key]
+
+def run_config(job):
+    index, (name, eps, ratio, seed) = job
+    stream = WORKER["streams"][(ratio, seed)]
+    keys, weights, chunk = stream.keys, stream.weights, WORKER["chunk"]
+    make = SKETCHES[name][0]
+    random.seed(seed)
+    sketch = make(eps)
+    start = time.perf_counter()
+    for i in range(0, stream.n, chunk):
+        apply_batch(sketch, keys[i:i + chunk], weights[i:i + chunk])
+    elapsed = time.perf_counter() - start
+    row = {
+        "sketch": name, "eps": eps, "ratio": ratio, "seed": seed, "events": stream.n,
+        "update_seconds": elapsed,
+        "throughput": stream.n / elapsed if elapsed else float("inf"),
+        "bytes": usage(sketch)["total"],
+    }
+    row.update(evaluate(sketch, exact_counts((ratio, seed)), WORKER["k"]))
+    return index, row
+
+# --- driver ---
+
+def grid(sketches, epsilons, ratios, seeds):
+    # smallest eps (largest sketches) first, so the long jobs do not start last
+    return [(name, eps, ratio, seed) for eps in sorted(epsilons)
+            for name in sketches for ratio in ratios for seed in seeds]
+
+def sweep(sketches=None, epsilons=EPSILONS, ratios=(0.5,), seeds=(0,), n=10**5, skew=1.1,
+          universe=2**21, k=10, processes=None, chunk=CHUNK, log=None):
+    """
+    Run every (sketch, eps, ratio, seed) configuration on a pool of
+    `processes` workers (default: one per core) and return the rows in grid
+    order. The stream of a (ratio, seed) pair is a bounded-deletion stream
+    of n Zipf(skew) insertions over [1, universe], see
+    benchmarks.streams. `log` is called with each row as it completes.
+    """
+    if sketches is None:
+        # every configuration is ingested through apply_batch, the /batch entries would repeat rows
+        sketches = [name for name, (_, update, _) in SKETCHES.items() if update not in BATCHED]
+    for name in sketches:
+        if name not in SKETCHES:
+            raise ValueError("unknown sketch %r" % name)
+    jobs = grid(sketches, epsilons, ratios, seeds)
+    streams = {}
+    try:
+        for ratio in ratios:
+            for seed in seeds:
+                streams[(ratio, seed)] = SharedStream(*bounded_deletion_stream(n, ratio, skew, universe, seed))
+        rows = [None] * len(jobs)
+        with mp.Pool(processes, initializer=init_worker, initargs=(streams, universe, k, chunk)) as pool:
+            for index, row in pool.imap_unordered(run_config, enumerate(jobs)):
+                if log is not None:
+                    log(row)
+                rows[index] = row
+        return rows
+    finally:
+        for stream in streams.values():
+            stream.close(unlink=True)
+
+def write_table(rows, f):
+    writer = csv.DictWriter(f, fieldnames=COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(rows)
@@ -0,0 +1,136 @@
+"""
+Accuracy evaluation against an exact baseline kept in a NumPy count array.
+
+    exact = ExactCounts(universe)
+    for row in evaluate_stream({"ISS": SpaceSaving(k)}, exact, chunks(path), every=10**5, k=100):
+        print(row)
+
+Keys must be integers in [0, universe). Errors are measured over the keys
+with a nonzero true frequency, as in Evaluation.ipynb, and top-k precision,
+recall and F1 compare the k largest true and estimated frequencies.
+"""
+import numpy as np
+from sharded import apply_batch, candidates
+
+
+class ExactCounts():
+    """
+    Exact net frequency of every key in [0, universe), 4 bytes per key by
+    default, which is enough while no frequency exceeds 2^31.
+    """
+    def __init__(self, universe, dtype=np.int32):
+        self.universe = universe
+        self.counts = np.zeros(universe, dtype=dtype)
+        self.total = 0
+
+    def update(self, item, weight=1):
+        self.counts[item] += weight
+        self.total += weight
+
+    def update_many(self, keys, weights=None):
+        keys = np.asarray(keys)
+        assert len(keys) == 0 or (keys.min() >= 0 and keys.max() < self.universe)
+        if weights is None:
+            weights = np.ones(len(keys), dtype=self.counts.dtype)
+        np.add.at(self.counts, keys, weights)
+        self.total += int(np.sum(weights))
+
+    def query(self, item):
+        return int(self.counts[item])
+
+    def query_many(self, keys):
+        return self.counts[keys]
+
+    def support(self):
+        # keys with a nonzero frequency
+        return np.flatnonzero(self.counts)
+
+    def topk(self, k):
+        return largest(np.arange(self.universe), self.counts, k)
+
+    def heavy_hitters(self, phi):
+        return np.flatnonzero(self.counts >= phi * self.total)
+
+
+def largest(keys, values, k):
+    # the keys of the k largest values, unordered
+    if len(keys) <= k:
+        return np.asarray(keys)
+    return np.asarray(keys)[np.argpartition(values, len(values) - k)[-k:]]
+
+def estimates(sketch, keys):
+    if hasattr(sketch, "query_many"):
+        return np.asarray(sketch.query_many(keys), dtype=np.float64)
+    return np.fromiter((sketch.query(x) for x in keys.tolist()), dtype=np.float64, count=len(keys))
+
+def precision_recall_f1(true_keys, estimated_keys):
+    hits = len(np.intersect1d(true_keys, estimated_keys))
+    precision = hits / len(estimated_keys) if len(estimated_keys) else 0.0
+    recall = hits / len(true_keys) if len(true_keys) else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+def evaluate(sketch, exact, k=None):
+    """
+    Score `sketch` against `exact`: average relative error (ARE) and max
+    absolute error over the keys present, and with k given, precision,
+    recall and F1 of its top-k. Sketches that track keys are ranked over
+    their own candidates, counter-only sketches over every present key.
+    """
+    keys = exact.support()
+    true = exact.query_many(keys).astype(np.float64)
+    estimated = estimates(sketch, keys)
+    errors = np.abs(true - estimated)
+    result = {
+        "are": float(np.mean(errors / np.abs(true))) if len(keys) else 0.0,
+        "max_error": float(errors.max()) if len(keys) else 0.0,
+    }
+    if k is not None:
+        tracked = candidates(sketch)
+        if tracked is None:
+            ranked, values = keys, estimated
+        else:
+            ranked = np.array(tracked, dtype=np.int64)
+            values = estimates(sketch, ranked)
+        result["precision"], result["recall"], result["f1"] = precision_recall_f1(
+            exact.topk(k), largest(ranked, values, k))
+    return result
+
+def evaluate_stream(sketches, exact, source, every=None, checkpoints=(), k=None):
+    """
+    Feed the (keys, weights) chunks of `source` to every sketch in the dict
+    `sketches` and to `exact`, and yield one row per sketch at each
+    checkpoint: every `every` events, at the listed event counts and at the
+    end of the stream. Rows hold the checkpoint, the sketch name and the
+    `evaluate` metrics.
+    """
+    pending = sorted(checkpoints)
+    seen = 0
+    def next_checkpoint():
+        upcoming = [c for c in pending if c > seen]
+        if every:
+            upcoming.append((seen // every + 1) * every)
+        return min(upcoming) if upcoming else None
+
+    def score():
+        for name, sketch in sketches.items():
+            row = {"events": seen, "sketch": name}
+            row.update(evaluate(sketch, exact, k))
+            yield row
+
+    scored = -1
+    for keys, weights in source:
+        start = 0
+        while start < len(keys):
+            checkpoint = next_checkpoint()
+            end = len(keys) if checkpoint is None else min(len(keys), start + checkpoint - seen)
+            for sketch in sketches.values():
+                apply_batch(sketch, keys[start:end], weights[start:end])
+            exact.update_many(keys[start:end], weights[start:end])
+            seen += end - start
+            start = end
+            if seen == checkpoint:
+                yield from score()
+                scored = seen
+    if scored != seen:
+        yield from score()
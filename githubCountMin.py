@@ -1,8 +1,10 @@
 #https://github.com/rafacarrascosa/countminsketch/blob/master/countminsketch.py
 # -*- coding: utf-8 -*-
 import math
-import hashlib
 import array
+import copy
+import numpy as np
+from hashing import hash64, indices, hash64_many, indices_many
 
 class CountMinSketch(object):
     """
@@ -30,10 +32,10 @@ class CountMinSketch(object):
     the user.
     """
 
-    def __init__(self, m, d):
+    def __init__(self, m, d, seed=0):
         """ `m` is the size of the hash tables, larger implies smaller
         overestimation. `d` the amount of hash tables, larger implies lower
-        probability of overestimation.
+        probability of overestimation. `seed` selects the hash functions.
         """
         if not m or not d:
             raise ValueError("Table size (m) and amount of hash functions (d)"
@@ -41,6 +43,7 @@ class CountMinSketch(object):
         self.m = math.ceil(m)
         self.d = d
         self.n = 0
+        self.seed = seed
         self.tables = []
         for _ in range(d):
             table = array.array("i", (0 for _ in range(self.m)))
@@ -51,10 +54,7 @@ class CountMinSketch(object):
         # return number of counters
         return self.m * self.d
     def _hash(self, x):
-        md5 = hashlib.md5(str(hash(x)).encode('utf-8'))
-        for i in range(self.d):
-            md5.update(str(i).encode('utf-8'))
-            yield int(md5.hexdigest(), 16) % self.m
+        return indices(hash64(x, self.seed), self.d, self.m)
 
     def add(self, x, value=1):
         """
@@ -63,8 +63,12 @@ class CountMinSketch(object):
             sketch.add(x)
         Effectively counts `x` as occurring once.
         """
+        self.add_at(self._hash(x), value)
+
+    def add_at(self, idx, value=1):
+        # `add` for a key whose row indices `idx` are already known
         self.n += value
-        for table, i in zip(self.tables, self._hash(x)):
+        for table, i in zip(self.tables, idx):
             table[i] += value
 
     def query(self, x):
@@ -72,7 +76,16 @@ class CountMinSketch(object):
         Return an estimation of the amount of times `x` has ocurred.
         The returned value always overestimates the real value.
         """
-        return min(table[i] for table, i in zip(self.tables, self._hash(x)))
+        return self.query_at(self._hash(x))
+
+    def query_at(self, idx):
+        return min(table[i] for table, i in zip(self.tables, idx))
+
+    def freeze(self):
+        # copy of the counters for concurrent readers, each row is one memcpy
+        view = copy.copy(self)
+        view.tables = [copy.copy(table) for table in self.tables]
+        return view
 
     def __getitem__(self, x):
         """
@@ -93,4 +106,85 @@ class CountMinSketch(object):
                 if(arr[i] == 0):
                     #print(arr[i])
                     ans+=1
-        return 1 - ans/(self.m*self.d)
\ No newline at end of file
+        return 1 - ans/(self.m*self.d)
+
+
+class VectorizedCountMinSketch(object):
+    """
+    Count-min Sketch that keeps the `d` tables in one 2-D NumPy array. Row
+    indices come from the shared `hashing` module, which hashes a whole
+    batch of integer keys with NumPy, so `add_many` and `query_many` cost a
+    handful of array operations per batch. `add` and `query` are thin
+    wrappers around the same hash.
+    """
+
+    def __init__(self, m, d, seed=0):
+        if not m or not d:
+            raise ValueError("Table size (m) and amount of hash functions (d)"
+                             " must be non-zero")
+        self.m = math.ceil(m)
+        self.d = d
+        self.n = 0
+        self.seed = seed
+        self.tables = np.zeros((d, self.m), dtype=np.int32)
+        self.rows = np.arange(d)[:, None]
+
+    def space(self):
+        # return number of counters
+        return self.m * self.d
+
+    def _hash(self, x):
+        return indices(hash64(x, self.seed), self.d, self.m)
+
+    def _hash_many(self, keys):
+        # (d, len(keys)) array of column indices
+        if not isinstance(keys, np.ndarray) and keys and isinstance(keys[0], int):
+            keys = np.asarray(keys, dtype=np.int64)
+        return indices_many(hash64_many(keys, self.seed), self.d, self.m)
+
+    def add(self, x, value=1):
+        """
+        Count element `x` as if had appeared `value` times.
+        """
+        self.n += value
+        for table, i in zip(self.tables, self._hash(x)):
+            table[i] += value
+
+    def add_many(self, keys, values=None):
+        """
+        Count every key of the batch, `values` defaults to one per key.
+        """
+        idx = self._hash_many(keys)
+        if values is None:
+            values = np.ones(idx.shape[1], dtype=self.tables.dtype)
+        else:
+            values = np.asarray(values, dtype=self.tables.dtype)
+        self.n += int(values.sum())
+        np.add.at(self.tables, (self.rows, idx), values)
+
+    def query(self, x):
+        """
+        Return an estimation of the amount of times `x` has ocurred.
+        The returned value always overestimates the real value.
+        """
+        return int(min(table[i] for table, i in zip(self.tables, self._hash(x))))
+
+    def query_many(self, keys):
+        return self.tables[self.rows, self._hash_many(keys)].min(axis=0)
+
+    def freeze(self):
+        view = copy.copy(self)
+        view.tables = self.tables.copy()
+        return view
+
+    def __getitem__(self, x):
+        """
+        A convenience method to call `query`.
+        """
+        return self.query(x)
+
+    def __len__(self):
+        return self.n
+
+    def density(self):
+        return np.count_nonzero(self.tables) / (self.m * self.d)
@@ -0,0 +1,77 @@
+"""
+Seeded, process-stable 64-bit hashing shared by all hashed sketches.
+
+Integers go through the splitmix64 finalizer, bytes and strings through a
+keyed 8 byte blake2b digest, so the same key hashes to the same value in
+every process regardless of PYTHONHASHSEED, and sketches built in different
+processes can be merged or compared. All `d` row indices of a key are
+derived from its single 64-bit hash by double hashing
+    index_i = (h1 + i * h2) mod m,  h1 = low 32 bits, h2 = high 32 bits | 1
+and fingerprints are taken from a remix of the same hash.
+"""
+import hashlib
+import numpy as np
+
+MASK32 = (1 << 32) - 1
+MASK64 = (1 << 64) - 1
+GOLDEN = 0x9E3779B97F4A7C15
+MIX1 = 0xBF58476D1CE4E5B9
+MIX2 = 0x94D049BB133111EB
+FINGERPRINT_SALT = 0x5851F42D4C957F2D
+
+
+def mix64(z):
+    # splitmix64 finalizer
+    z = (z ^ (z >> 30)) * MIX1 & MASK64
+    z = (z ^ (z >> 27)) * MIX2 & MASK64
+    return z ^ (z >> 31)
+
+def hash64(x, seed=0):
+    """
+    Return a 64-bit hash of an int, bytes or str key (anything else is
+    hashed through str()).
+    """
+    if isinstance(x, (int, np.integer)):
+        return mix64(((int(x) & MASK64) + (seed + 1) * GOLDEN) & MASK64)
+    if isinstance(x, str):
+        x = x.encode("utf-8")
+    elif not isinstance(x, (bytes, bytearray)):
+        x = str(x).encode("utf-8")
+    digest = hashlib.blake2b(x, digest_size=8, key=seed.to_bytes(8, "little")).digest()
+    return int.from_bytes(digest, "little")
+
+def indices(h, d, m):
+    # the d row indices in [0, m) of a key hashing to h
+    h1 = h & MASK32
+    h2 = (h >> 32) | 1
+    return [(h1 + i * h2) % m for i in range(d)]
+
+def fingerprint(h, bits=16):
+    return mix64(h ^ FINGERPRINT_SALT) >> (64 - bits)
+
+# --- batch variants, operating on uint64 arrays ---
+
+def mix64_many(z):
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(MIX1)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(MIX2)
+    return z ^ (z >> np.uint64(31))
+
+def hash64_many(keys, seed=0):
+    """
+    Hash a batch of keys to a uint64 array, identical to hash64 per key.
+    Integer arrays are hashed with NumPy, other sequences key by key.
+    """
+    if isinstance(keys, np.ndarray) and keys.dtype.kind in "iu":
+        z = keys.astype(np.uint64) + np.uint64((seed + 1) * GOLDEN & MASK64)
+        return mix64_many(z)
+    return np.fromiter((hash64(x, seed) for x in keys), dtype=np.uint64, count=len(keys))
+
+def indices_many(h, d, m):
+    # (d, len(h)) array of row indices
+    h1 = h & np.uint64(MASK32)
+    h2 = (h >> np.uint64(32)) | np.uint64(1)
+    i = np.arange(d, dtype=np.uint64)[:, None]
+    return ((h1[None, :] + i * h2[None, :]) % np.uint64(m)).astype(np.intp)
+
+def fingerprint_many(h, bits=16):
+    return mix64_many(h ^ np.uint64(FINGERPRINT_SALT)) >> np.uint64(64 - bits)
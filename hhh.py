@@ -0,0 +1,98 @@
+"""
+Hierarchical heavy hitters over IPv4 prefixes in the bounded-deletion
+model, after Mitzenmacher, Steinke and Thaler, "Hierarchical Heavy Hitters
+with the Space Saving Algorithm" (ALENEX 2012), with one SpaceSaving±
+summary per prefix length.
+
+    h = HierarchicalHeavyHitters(1000)
+    for keys, weights in readers.chunks(trace):
+        h.update_many(keys, weights)
+    for network, length, lower, upper in h.hhh(0.01):
+        print(prefix_str(network, length), lower, upper)
+"""
+import socket
+import struct
+import numpy as np
+from spacesaving import IntSpaceSaving
+
+MASK32 = (1 << 32) - 1
+
+
+def prefix_str(network, length):
+    return "%s/%d" % (socket.inet_ntoa(struct.pack("!I", network)), length)
+
+
+class HierarchicalHeavyHitters():
+    """
+    One SpaceSaving± summary of k counters per prefix length. An address
+    updates its prefix (the address masked to the length) at every level;
+    batches are masked with NumPy once per level and each level aggregates
+    its batch first, so the coarse levels, which see few distinct prefixes,
+    add little to the cost of the /32 level.
+    """
+    def __init__(self, k, lengths=(8, 16, 24, 32), summary=IntSpaceSaving):
+        self.k = k
+        self.lengths = sorted(lengths)
+        self.masks = [MASK32 << (32 - length) & MASK32 for length in self.lengths]
+        self.levels = [summary(k) for _ in self.lengths]
+        self.total_items = 0
+
+    def update(self, address, weight=1):
+        self.total_items += weight
+        for mask, level in zip(self.masks, self.levels):
+            level.update(address & mask, weight)
+
+    def update_many(self, addresses, weights=None):
+        addresses = np.asarray(addresses, dtype=np.int64)
+        if weights is None:
+            weights = np.ones(len(addresses), dtype=np.int64)
+        else:
+            weights = np.asarray(weights, dtype=np.int64)
+        self.total_items += int(weights.sum())
+        for mask, level in zip(self.masks, self.levels):
+            level.update_many(addresses & mask, weights)
+
+    def query(self, network, length):
+        # estimated (unconditioned) count of a prefix
+        index = self.lengths.index(length)
+        return self.levels[index].query(network & self.masks[index])
+
+    def hhh(self, phi):
+        """
+        The hierarchical heavy hitters: prefixes whose count, discounted by
+        their heavy descendants, reaches phi * (inserts - deletes). Levels
+        are scanned from the most specific one; a prefix is discounted by the
+        HHHs below it that are not already under another HHH below it.
+        Returns (network, length, lower, upper) with bounds on the
+        conditioned count. Using the upper bound for the test misses no true
+        HHH; with level errors of at most I/k (I inserts), `upper` is off by
+        at most (1 + number of discounted descendants) * I/k.
+        """
+        threshold = phi * self.total_items
+        result = []
+        frontier = [] # found HHHs without a found HHH above them, as (network, lower, upper)
+        for index in reversed(range(len(self.levels))):
+            level, mask, length = self.levels[index], self.masks[index], self.lengths[index]
+            error = level.getmininsert() if level.isFull() else 0
+            below = {}
+            for entry in frontier:
+                below.setdefault(entry[0] & mask, []).append(entry)
+            found = []
+            for network, insert, delete in level.items():
+                upper = insert - delete
+                if upper < threshold:
+                    continue
+                lower = max(0, upper - error)
+                descendants = below.get(network, [])
+                conditioned_upper = upper - sum(d[1] for d in descendants)
+                if conditioned_upper < threshold:
+                    continue
+                conditioned_lower = max(0, lower - sum(d[2] for d in descendants))
+                result.append((network, length, conditioned_lower, conditioned_upper))
+                found.append((network, lower, upper))
+            covered = {network for network, _, _ in found}
+            frontier = [entry for entry in frontier if entry[0] & mask not in covered] + found
+        return result
+
+    def space(self):
+        return sum(level.space() for level in self.levels)
@@ -0,0 +1,183 @@
+"""
+Resident memory of the sketches in bytes, and constructors for a byte budget.
+
+`space()` counts abstract counters, as in the paper. `usage(sketch)`
+instead walks the objects a sketch owns and adds up sys.getsizeof of each
+(NumPy buffers by their nbytes), broken down by component:
+
+    >>> usage(SpaceSaving(1000))
+    {'heap': ..., 'key index': ..., 'net index': ..., 'other': ..., 'total': ...}
+
+Objects shared with the interpreter (classes, functions, small ints, None)
+are not counted, and every object is counted once, in the first component
+that reaches it. `with_budget(cls, budget, ...)` returns the largest
+instance whose usage after filling it with distinct int keys stays within
+`budget` bytes.
+"""
+import array
+import sys
+import types
+import numpy as np
+
+from spacesaving import SpaceSaving, IntSpaceSaving, StreamSummary, DoubleSpaceSaving, WindowedSpaceSaving
+from unbiasedSpaceSaving import UnbiasedSpaceSaving, UnbiasedDSS
+from githubCountMin import CountMinSketch, VectorizedCountMinSketch
+from CSSS import CSSS_CountSketch, CSSS_sketch
+from Panakos import Panakos
+from HeavyKeeper import HeavyKeeper, heavykeeper_minheap, ssummary
+from hhh import HierarchicalHeavyHitters
+from sharded import apply_batch
+
+SHARED = (type, types.FunctionType, types.BuiltinFunctionType, types.ModuleType, bool, type(None))
+
+
+def deep_size(obj, seen):
+    """
+    Bytes of `obj` and everything it references that is not in `seen`
+    (ids), which is updated. Iterative, the bucket lists are long chains.
+    """
+    total = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, SHARED) or (type(obj) is int and -5 <= obj <= 256):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, np.ndarray):
+            if obj.base is not None:
+                stack.append(obj.base)
+        elif isinstance(obj, memoryview):
+            stack.append(obj.obj)
+        elif type(obj).__name__ == "list_iterator":
+            # the list it walks, e.g. the uniforms of rng.BufferedRandom
+            stack.append(obj.__reduce__()[1][0])
+        elif isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)) or type(obj).__name__ == "deque":
+            stack.extend(obj)
+        elif isinstance(obj, (int, float, str, bytes, bytearray, array.array)):
+            pass
+        else:
+            if hasattr(obj, "__dict__"):
+                stack.append(obj.__dict__)
+            for cls in type(obj).__mro__:
+                for name in getattr(cls, "__slots__", ()):
+                    if hasattr(obj, name):
+                        stack.append(getattr(obj, name))
+    return total
+
+# --- per class components ---
+# each returns ({component: tuple of objects}, {child name: nested sketch})
+
+COMPONENTS = {
+    SpaceSaving: lambda s: ({"heap": (s.weight_heap,), "key index": (s.item_to_indices,), "net index": (s.net,)}, {}),
+    IntSpaceSaving: lambda s: ({"counters": (s.keys, s.inserts, s.deletes), "key index": (s.table, s.cells)}, {}),
+    StreamSummary: lambda s: ({"insert index": (s.inserts,), "deletes": (s.deletes,), "net index": (s.net,)}, {}),
+    UnbiasedSpaceSaving: lambda s: ({"heap": (s.weight_heap,), "key index": (s.item_to_indices,), "rng": (s.rng,)}, {}),
+    DoubleSpaceSaving: lambda s: ({}, {"insert": s.InsertSpacesaving, "delete": s.DeleteSpacesaving}),
+    WindowedSpaceSaving: lambda s: ({}, {"epoch%d" % i: epoch for i, epoch in enumerate(s.epochs)}),
+    UnbiasedDSS: lambda s: ({}, {"insert": s.insertUSS, "delete": s.deleteUSS}),
+    CountMinSketch: lambda s: ({"counters": (s.tables,)}, {}),
+    VectorizedCountMinSketch: lambda s: ({"counters": (s.tables,)}, {}),
+    CSSS_CountSketch: lambda s: ({"counters": (s.table_positive, s.table_negative), "hash": (s.a, s.b, s.c, s.d), "rng": (s.rng,)}, {}),
+    CSSS_sketch: lambda s: ({}, {"count_sketch": s.count_sketch}),
+    Panakos: lambda s: ({"bitmaps": (s.bitmap, s.bitmap_morethanonce)}, {"CountMin": s.CountMin, "SpaceSaving": s.SpaceSaving}),
+    HeavyKeeper: lambda s: ({"buckets": (s.fingerprints, s.counts), "decay table": (s.decay,), "rng": (s.rng,)}, {"heap": s.min_heap}),
+    heavykeeper_minheap: lambda s: ({"heap": (s.heap,), "key index": (s.pos,)}, {}),
+    ssummary: lambda s: ({"index": (s.index,)}, {}),
+    HierarchicalHeavyHitters: lambda s: ({}, {"/%d" % length: level for length, level in zip(s.lengths, s.levels)}),
+}
+
+def components(sketch, seen, prefix=""):
+    cls = type(sketch)
+    if cls not in COMPONENTS:
+        raise TypeError("no memory accounting for %s" % cls.__name__)
+    parts, children = COMPONENTS[cls](sketch)
+    sizes = {}
+    for name, objects in parts.items():
+        sizes[prefix + name] = sum(deep_size(obj, seen) for obj in objects)
+    for name, child in children.items():
+        sizes.update(components(child, seen, prefix + name + "."))
+    return sizes
+
+def usage(sketch):
+    """
+    Resident bytes of `sketch` by component, plus "other" (object headers,
+    attribute dicts, scalars) and the "total".
+    """
+    sizes = components(sketch, set())
+    total = deep_size(sketch, set())
+    sizes["other"] = total - sum(sizes.values())
+    sizes["total"] = total
+    return sizes
+
+# --- byte budgets ---
+
+# class -> the constructor argument that sets its size
+SIZE_ARGUMENT = {
+    SpaceSaving: "k",
+    IntSpaceSaving: "k",
+    StreamSummary: "k",
+    UnbiasedSpaceSaving: "k",
+    DoubleSpaceSaving: "spacebudget",
+    UnbiasedDSS: "k",
+    CountMinSketch: "m",
+    VectorizedCountMinSketch: "m",
+    CSSS_CountSketch: "t",
+    Panakos: "memory_budget",
+    HeavyKeeper: "M2",
+    HierarchicalHeavyHitters: "k",
+}
+
+# class -> (distinct keys, repeats) that bring an instance of that size to
+# its steady memory; the counter arrays are allocated up front
+FILL = {
+    CountMinSketch: lambda size, kwargs: (0, 0),
+    VectorizedCountMinSketch: lambda size, kwargs: (0, 0),
+    CSSS_CountSketch: lambda size, kwargs: (0, 0),
+    HeavyKeeper: lambda size, kwargs: (4 * kwargs["k"], 1),
+    # only keys seen more than T times reach its SpaceSaving
+    Panakos: lambda size, kwargs: (size // 2, kwargs.get("T", 16) + 1),
+}
+
+# class -> smallest valid size, the delete half of a DSS needs spacebudget > 1/eps
+MINIMUM = {
+    DoubleSpaceSaving: lambda kwargs: int(1 / kwargs["eps"]) + 1,
+    UnbiasedDSS: lambda kwargs: int(1 / kwargs["eps"]) + 1,
+}
+
+def filled(cls, size, kwargs):
+    # an instance after inserting and then deleting distinct int keys
+    sketch = cls(**{SIZE_ARGUMENT[cls]: size}, **kwargs)
+    distinct, repeats = FILL[cls](size, kwargs) if cls in FILL else (2 * size, 1)
+    if distinct:
+        keys = (np.arange(1, distinct + 1, dtype=np.int64) * 2654435761 % (1 << 31)).tolist()
+        apply_batch(sketch, keys * repeats, [1] * (distinct * repeats))
+        apply_batch(sketch, keys, [-1] * distinct)
+    return sketch
+
+def with_budget(cls, budget, low=64, high=1024, **kwargs):
+    """
+    The largest `cls` instance, sized through its SIZE_ARGUMENT with the
+    other arguments from kwargs, whose usage() total once filled with int
+    keys (see FILL) is at most `budget` bytes. The size is estimated from a
+    linear fit of the usage at `low` and `high` (raised to twice the
+    MINIMUM size of the class), then reduced until it fits (dicts grow in
+    steps).
+    """
+    if cls not in SIZE_ARGUMENT:
+        raise TypeError("no byte budget constructor for %s" % cls.__name__)
+    minimum = MINIMUM[cls](kwargs) if cls in MINIMUM else 1
+    low = max(low, 2 * minimum)
+    high = max(high, 2 * low)
+    a = usage(filled(cls, low, kwargs))["total"]
+    b = usage(filled(cls, high, kwargs))["total"]
+    per_unit = (b - a) / (high - low)
+    size = max(minimum, int(low + (budget - a) / per_unit))
+    while size >= minimum and usage(filled(cls, size, kwargs))["total"] > budget:
+        size = min(size - 1, int(size * 0.95))
+    if size < minimum:
+        raise ValueError("%d bytes do not fit a %s of the minimum %s %d" % (budget, cls.__name__, SIZE_ARGUMENT[cls], minimum))
+    return cls(**{SIZE_ARGUMENT[cls]: size}, **kwargs)
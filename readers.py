@@ -0,0 +1,216 @@
+"""
+Streaming readers that turn traces and event files into fixed-size chunks
+of (keys, weights) int64 arrays, ready for the batch `update_many` methods.
+
+    for keys, weights in chunks("data/tcp/equinix-chicago.dirA.pcap.gz"):
+        sketch.update_many(keys, weights)
+
+Only one chunk is held in memory at a time, so a trace of any size replays
+in constant memory. Weights are +1 per event unless the source carries its
+own weights; negative weights are deletions.
+"""
+import csv
+import gzip
+import itertools
+import socket
+import struct
+import numpy as np
+from hashing import hash64, MASK64
+from sharded import apply_batch
+
+CHUNK = 1 << 16
+
+# pcap link types and the offset of the IP header in their frames
+ETHERNET = 1
+LINK_OFFSETS = {
+    0: 4,           # BSD loopback
+    ETHERNET: 14,
+    12: 0,          # raw IP (OpenBSD)
+    101: 0,         # raw IP, used by the CAIDA traces
+    113: 16,        # Linux cooked capture
+    228: 0,         # raw IPv4
+}
+VLAN_TAGS = (0x8100, 0x88A8)
+IPV4 = 0x0800
+
+
+def open_file(path, mode="rb"):
+    # transparently decompress .gz files
+    if str(path).endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+def as_keys(values):
+    # python ints in [-2^63, 2^64) to int64, wrapping the upper half like hash64_many does
+    return np.array([x & MASK64 for x in values], dtype=np.uint64).view(np.int64)
+
+def parse_key(s):
+    """
+    Integer keys are kept, dotted IPv4 addresses become their 32-bit value and
+    anything else is replaced by its 64-bit hash.
+    """
+    try:
+        return int(s)
+    except ValueError:
+        pass
+    try:
+        return struct.unpack("!I", socket.inet_aton(s))[0]
+    except OSError:
+        return hash64(s)
+
+def signed_key(s):
+    # (key, sign) of a text field: a negative integer -x is a deletion of x,
+    # keys that are not integers are parsed as usual and never deletions
+    try:
+        x = int(s)
+    except ValueError:
+        return parse_key(s), 1
+    return (-x, -1) if x < 0 else (x, 1)
+
+def split_signs(keys, weights):
+    # datasets that store a deletion of x as the key -x, like the notebook's json streams;
+    # keys must be signed integers as stored, not hashes or wrapped values
+    negative = keys < 0
+    if negative.any() and keys.min() == np.iinfo(np.int64).min:
+        raise ValueError("key -2^63 has no positive counterpart")
+    return np.abs(keys), np.where(negative, -weights, weights)
+
+def batched(events, chunk):
+    # lists of up to `chunk` events
+    events = iter(events)
+    while True:
+        batch = list(itertools.islice(events, chunk))
+        if not batch:
+            return
+        yield batch
+
+
+def pcap_chunks(path, chunk=CHUNK, key="src", weight="packets"):
+    """
+    Chunks of a libpcap trace (optionally gzipped). Each IPv4 packet is one
+    event keyed by its source address ("src"), destination ("dst") or both
+    ("pair", src << 32 | dst), weighted by 1 ("packets") or its IP length
+    ("bytes"). Other packets are skipped.
+    """
+    assert key in ("src", "dst", "pair") and weight in ("packets", "bytes")
+    with open_file(path) as f:
+        header = f.read(24)
+        if header[:4] in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+            endian = "<"
+        elif header[:4] in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+            endian = ">"
+        else:
+            raise ValueError("%s is not a pcap file" % path)
+        linktype = struct.unpack(endian + "I", header[20:24])[0] & 0x0FFFFFFF
+        if linktype not in LINK_OFFSETS:
+            raise ValueError("unsupported pcap link type %d" % linktype)
+        record = struct.Struct(endian + "IIII")
+        addresses = struct.Struct("!II")
+
+        def packets():
+            while True:
+                head = f.read(16)
+                if len(head) < 16:
+                    return
+                caplen = record.unpack(head)[2]
+                packet = f.read(caplen)
+                offset = LINK_OFFSETS[linktype]
+                if linktype == ETHERNET:
+                    ethertype = int.from_bytes(packet[12:14], "big")
+                    while ethertype in VLAN_TAGS:
+                        offset += 4
+                        ethertype = int.from_bytes(packet[offset - 2:offset], "big")
+                    if ethertype != IPV4:
+                        continue
+                if len(packet) < offset + 20 or packet[offset] >> 4 != 4:
+                    continue
+                src, dst = addresses.unpack_from(packet, offset + 12)
+                x = src if key == "src" else dst if key == "dst" else src << 32 | dst
+                w = 1 if weight == "packets" else int.from_bytes(packet[offset + 2:offset + 4], "big")
+                yield x, w
+
+        for batch in batched(packets(), chunk):
+            keys, weights = zip(*batch)
+            yield as_keys(keys), np.array(weights, dtype=np.int64)
+
+def flow_chunks(path, chunk=CHUNK, column=3, weight_column=None, sep="\t", header=True):
+    """
+    Chunks of a delimited flow file such as the CAIDA csv exports the
+    notebook reads with pandas: one event per row keyed by `column` (see
+    parse_key), weighted by `weight_column` if given.
+    """
+    with open_file(path, "rt") as f:
+        rows = csv.reader(f, delimiter=sep)
+        if header:
+            next(rows, None)
+        for batch in batched(rows, chunk):
+            keys = as_keys([parse_key(row[column]) for row in batch])
+            if weight_column is None:
+                weights = np.ones(len(batch), dtype=np.int64)
+            else:
+                weights = np.array([int(row[weight_column]) for row in batch], dtype=np.int64)
+            yield keys, weights
+
+def text_chunks(path, chunk=CHUNK, signed=False):
+    """
+    Chunks of a line-delimited event file, one `key` or `key weight` (space
+    or comma separated) per line. With signed=True a negative integer key -x
+    is a deletion of x; IPv4 and hashed keys are always insertions.
+    """
+    with open_file(path, "rt") as f:
+        lines = (line.replace(",", " ").split() for line in f)
+        for batch in batched((fields for fields in lines if fields), chunk):
+            weights = np.array([int(fields[1]) if len(fields) > 1 else 1 for fields in batch], dtype=np.int64)
+            if signed:
+                keys, signs = zip(*(signed_key(fields[0]) for fields in batch))
+                keys, weights = as_keys(keys), weights * np.array(signs, dtype=np.int64)
+            else:
+                keys = as_keys([parse_key(fields[0]) for fields in batch])
+            yield keys, weights
+
+def npy_chunks(path, chunk=CHUNK, signed=False):
+    """
+    Chunks of a .npy file, memory mapped: a 1-D array of keys, or an (n, 2)
+    array of (key, weight) rows. `signed` as for text_chunks, it needs a
+    signed integer array.
+    """
+    data = np.load(path, mmap_mode="r")
+    if data.ndim not in (1, 2) or (data.ndim == 2 and data.shape[1] != 2):
+        raise ValueError("expected an (n,) or (n, 2) array, got %s" % (data.shape,))
+    if signed and data.dtype.kind != "i":
+        raise ValueError("signed=True needs signed integer keys, got %s" % data.dtype)
+    for start in range(0, len(data), chunk):
+        block = data[start:start + chunk]
+        if data.ndim == 1:
+            keys = np.array(block, dtype=np.int64)
+            weights = np.ones(len(keys), dtype=np.int64)
+        else:
+            keys = np.array(block[:, 0], dtype=np.int64)
+            weights = np.array(block[:, 1], dtype=np.int64)
+        if signed:
+            keys, weights = split_signs(keys, weights)
+        yield keys, weights
+
+def chunks(path, chunk=CHUNK, **kwargs):
+    # pick the reader from the file extension
+    name = str(path)
+    if name.endswith(".gz"):
+        name = name[:-3]
+    if name.endswith((".pcap", ".cap", ".dump")):
+        return pcap_chunks(path, chunk, **kwargs)
+    if name.endswith(".npy"):
+        return npy_chunks(path, chunk, **kwargs)
+    if name.endswith((".csv", ".tsv")):
+        return flow_chunks(path, chunk, **kwargs)
+    return text_chunks(path, chunk, **kwargs)
+
+def replay(sketch, source):
+    """
+    Feed every chunk of `source` (an iterable of (keys, weights), e.g. from
+    `chunks`) into the sketch's batch update and return the number of events.
+    """
+    events = 0
+    for keys, weights in source:
+        apply_batch(sketch, keys, weights)
+        events += len(keys)
+    return events
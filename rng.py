@@ -0,0 +1,54 @@
+"""
+Per-instance uniform variates for the randomized sketches.
+
+A seeded NumPy generator fills blocks of uniforms in [0, 1) that are handed
+out through a list iterator, so a draw costs one `next` instead of a NumPy
+call and sketches in one process do not share (or reseed) the global
+`random` state. The batch paths draw through `random` as well: how many
+variates a batch needs (min replacements, HeavyKeeper decays) depends on
+the state as it is updated, so they cannot be drawn up front.
+"""
+import itertools
+import operator
+import numpy as np
+
+
+class BufferedRandom():
+    def __init__(self, seed=0, block=1024):
+        self.generator = np.random.default_rng(seed)
+        self.block = block
+        self.refill()
+
+    def refill(self):
+        # the generator state before the block, which is all a snapshot needs
+        self.block_state = self.generator.bit_generator.state
+        self.uniforms = iter(self.generator.random(self.block).tolist())
+
+    def random(self):
+        try:
+            return next(self.uniforms)
+        except StopIteration:
+            self.refill()
+            return next(self.uniforms)
+
+    def state(self):
+        # JSON-ready state: regenerate the current block and skip what was used
+        return {"block": self.block, "block_state": self.block_state,
+                "position": self.block - operator.length_hint(self.uniforms)}
+
+    @classmethod
+    def restore(cls, state):
+        rng = cls.__new__(cls)
+        rng.generator = np.random.default_rng()
+        rng.generator.bit_generator.state = state["block_state"]
+        rng.block = state["block"]
+        rng.refill()
+        for _ in itertools.islice(rng.uniforms, state["position"]):
+            pass
+        return rng
+
+    def __getstate__(self):
+        return self.state()
+
+    def __setstate__(self, state):
+        self.__dict__.update(BufferedRandom.restore(state).__dict__)
@@ -0,0 +1,281 @@
+"""
+asyncio ingestion and query service around one sketch.
+
+    python server.py serve --port 7070 DoubleSpaceSaving 0.001 4000
+    python server.py load --port 7070 --clients 8 --batches 200
+
+Clients speak length-prefixed binary frames over TCP or a Unix socket. A
+request is a uint32 payload length, then a (uint8 opcode, uint32 count)
+header and its body:
+    UPDATE    count int64 keys, then count int64 signed weights, no reply
+    QUERY     count int64 keys, replied with count float64 estimates
+    TOPK      top `count` (item, estimate) pairs, replied as JSON
+    SNAPSHOT  count bytes of utf-8 path, the sketch is written there
+    FLUSH     replied once every earlier batch of the connection is applied,
+              or with the error of a malformed UPDATE sent since the last one
+A reply is a uint32 length, a status byte (0 ok, 1 error) and the payload.
+All updates go through a bounded queue drained by a single writer task, so
+the sketch is only ever mutated in one place and queries, served between
+two batches, always see a consistent sketch. A full queue stops the server
+from reading that connection, which pushes back on the sender through TCP
+flow control.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import struct
+import sys
+import time
+import numpy as np
+
+import snapshot
+from sharded import apply_batch, topk
+
+UPDATE = 1
+QUERY = 2
+TOPK = 3
+SNAPSHOT = 4
+FLUSH = 5
+OK = 0
+ERROR = 1
+
+LENGTH = struct.Struct("<I")
+HEADER = struct.Struct("<BI")
+MAX_FRAME = 1 << 26
+
+
+class SketchServer():
+    """
+    Serve `sketch`. At most `queue` batches wait for the writer, which
+    applies up to `coalesce` queued batches as one batch update.
+    """
+    def __init__(self, sketch, queue=64, coalesce=16):
+        self.sketch = sketch
+        self.queue = asyncio.Queue(queue)
+        self.coalesce = coalesce
+        self.events = 0
+        self.error = None
+        self.paused = asyncio.Lock() # held by SNAPSHOT while it copies the sketch
+        self.server = None
+        self.writer_task = None
+
+    async def start(self, host="127.0.0.1", port=None, path=None):
+        # listen on a Unix socket if `path` is given, else on TCP
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        self.writer_task = asyncio.ensure_future(self.write())
+        return self.server
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.writer_task.cancel()
+
+    async def write(self):
+        # the only task that mutates the sketch
+        while True:
+            batches = [await self.queue.get()]
+            while len(batches) < self.coalesce and not self.queue.empty():
+                batches.append(self.queue.get_nowait())
+            data = [b for b in batches if not isinstance(b, asyncio.Future)]
+            if data and self.error is None:
+                keys = np.concatenate([k for k, _ in data])
+                weights = np.concatenate([w for _, w in data])
+                async with self.paused:
+                    try:
+                        apply_batch(self.sketch, keys.tolist(), weights.tolist())
+                        self.events += len(keys)
+                    except Exception as e:
+                        # like the sharded workers, stop ingesting and report it on flush
+                        self.error = e
+            for b in batches:
+                if isinstance(b, asyncio.Future) and not b.done():
+                    if self.error is None:
+                        b.set_result(self.events)
+                    else:
+                        b.set_exception(RuntimeError("ingestion failed: %r" % self.error))
+            # let queries in between batches
+            await asyncio.sleep(0)
+
+    async def handle(self, reader, writer):
+        rejected = None # malformed UPDATE, reported on the next FLUSH as UPDATE has no reply
+        try:
+            while True:
+                try:
+                    length = LENGTH.unpack(await reader.readexactly(LENGTH.size))[0]
+                except asyncio.IncompleteReadError:
+                    break
+                if length > MAX_FRAME or length < HEADER.size:
+                    await self.reply(writer, ERROR, b"bad frame length")
+                    break
+                frame = await reader.readexactly(length)
+                op, count = HEADER.unpack_from(frame)
+                body = memoryview(frame)[HEADER.size:]
+                try:
+                    if op == UPDATE:
+                        if len(body) != 16 * count:
+                            if rejected is None:
+                                rejected = "UPDATE of %d events needs %d bytes" % (count, 16 * count)
+                            continue
+                        keys = np.frombuffer(body, dtype="<i8", count=count)
+                        weights = np.frombuffer(body, dtype="<i8", count=count, offset=8 * count)
+                        await self.queue.put((keys, weights))
+                        continue
+                    if op == FLUSH and rejected is not None:
+                        await self.reply(writer, ERROR, rejected.encode("utf-8"))
+                        rejected = None
+                        continue
+                    status, payload = OK, await self.request(op, count, body)
+                except Exception as e:
+                    status, payload = ERROR, str(e).encode("utf-8")
+                await self.reply(writer, status, payload)
+        finally:
+            writer.close()
+
+    async def request(self, op, count, body):
+        if op == QUERY:
+            keys = np.frombuffer(body, dtype="<i8", count=count).tolist()
+            return np.array([self.sketch.query(x) for x in keys], dtype="<f8").tobytes()
+        if op == TOPK:
+            return json.dumps([[item, float(estimate)] for item, estimate in topk(self.sketch, count)]).encode("utf-8")
+        if op == SNAPSHOT:
+            # copy and write off the event loop, the writer waits for the copy only
+            path = bytes(body[:count]).decode("utf-8")
+            loop = asyncio.get_running_loop()
+            async with self.paused:
+                events = self.events
+                frozen = await loop.run_in_executor(None, copy.deepcopy, self.sketch)
+            await loop.run_in_executor(None, snapshot.dump, frozen, path)
+            return json.dumps({"path": path, "events": events}).encode("utf-8")
+        if op == FLUSH:
+            done = asyncio.get_running_loop().create_future()
+            await self.queue.put(done)
+            return json.dumps({"events": await done}).encode("utf-8")
+        raise ValueError("unknown opcode %d" % op)
+
+    async def reply(self, writer, status, payload):
+        writer.write(LENGTH.pack(1 + len(payload)) + bytes([status]) + payload)
+        await writer.drain()
+
+
+class Client():
+    """
+    Connection to a SketchServer. Requests on one connection are answered
+    in order, so a client must not be shared by concurrent tasks.
+    """
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=None, path=None):
+        if path is not None:
+            return cls(*await asyncio.open_unix_connection(path))
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def send(self, op, count, body=b""):
+        self.writer.write(LENGTH.pack(HEADER.size + len(body)) + HEADER.pack(op, count) + body)
+        await self.writer.drain()
+
+    async def receive(self):
+        length = LENGTH.unpack(await self.reader.readexactly(LENGTH.size))[0]
+        frame = await self.reader.readexactly(length)
+        if frame[0] != OK:
+            raise RuntimeError(frame[1:].decode("utf-8"))
+        return frame[1:]
+
+    async def update(self, keys, weights=None):
+        keys = np.asarray(keys, dtype="<i8")
+        weights = np.ones(len(keys), dtype="<i8") if weights is None else np.asarray(weights, dtype="<i8")
+        await self.send(UPDATE, len(keys), keys.tobytes() + weights.tobytes())
+
+    async def query(self, keys):
+        keys = np.asarray(keys, dtype="<i8")
+        await self.send(QUERY, len(keys), keys.tobytes())
+        return np.frombuffer(await self.receive(), dtype="<f8")
+
+    async def topk(self, k):
+        await self.send(TOPK, k)
+        return [tuple(entry) for entry in json.loads(await self.receive())]
+
+    async def snapshot(self, path):
+        path = path.encode("utf-8")
+        await self.send(SNAPSHOT, len(path), path)
+        return json.loads(await self.receive())
+
+    async def flush(self):
+        # number of events the server has applied, including all of ours
+        await self.send(FLUSH, 0)
+        return json.loads(await self.receive())["events"]
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def load(clients=4, batches=100, batch=4096, skew=1.1, universe=2**20, seed=0, **connect):
+    """
+    Load generator: `clients` connections each send `batches` batches of
+    Zipf keys, and the ingestion rate up to the final flush is returned.
+    """
+    async def run(i):
+        rng = np.random.default_rng(seed + i)
+        client = await Client.connect(**connect)
+        for _ in range(batches):
+            await client.update(rng.zipf(skew, batch) % universe)
+        await client.flush()
+        await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(i) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    return clients * batches * batch / elapsed
+
+def number(s):
+    try:
+        return int(s)
+    except ValueError:
+        return float(s)
+
+async def serve(args):
+    sketch = snapshot.CLASSES[args.sketch](*[number(a) for a in args.args])
+    server = SketchServer(sketch, args.queue, args.coalesce)
+    await server.start(args.host, args.port, args.path)
+    print("serving %s on %s" % (args.sketch, args.path or "%s:%d" % (args.host, args.port)), file=sys.stderr)
+    await server.server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python server.py")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("serve", "load"):
+        p = sub.add_parser(name)
+        p.add_argument("--host", default="127.0.0.1")
+        p.add_argument("--port", type=int, default=7070)
+        p.add_argument("--path", help="Unix socket path instead of TCP")
+    s = sub.choices["serve"]
+    s.add_argument("--queue", type=int, default=64, help="batches waiting for the writer")
+    s.add_argument("--coalesce", type=int, default=16, help="queued batches applied at once")
+    s.add_argument("sketch", choices=sorted(snapshot.CLASSES))
+    s.add_argument("args", nargs="*", help="constructor arguments")
+    g = sub.choices["load"]
+    g.add_argument("--clients", type=int, default=4)
+    g.add_argument("--batches", type=int, default=100)
+    g.add_argument("--batch", type=int, default=4096)
+    g.add_argument("--skew", type=float, default=1.1)
+    g.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        asyncio.run(serve(args))
+        return 0
+    connect = {"path": args.path} if args.path else {"host": args.host, "port": args.port}
+    rate = asyncio.run(load(args.clients, args.batches, args.batch, args.skew, seed=args.seed, **connect))
+    print("%.0f events/s" % rate)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from operator import itemgetter
+import heapq
+import numpy as np
+from hashing import hash64, hash64_many
+
+DATA = 0
+CONTROL = 1
+STOP = 2
+HEADER = 2 # every slot starts with [number of events, opcode]
+# partitioning must not correlate with the hash the sketches use (seed 0)
+PARTITION_SEED = 0x5EED
+
+
+def owner(x, shards):
+    return hash64(x, PARTITION_SEED) % shards
+
+def owners(keys, shards):
+    return (hash64_many(keys, PARTITION_SEED) % np.uint64(shards)).astype(np.int64)
+
+
+def attach_shared(name):
+    # open a segment created by another process, which stays its owner
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 registers attached segments with the resource tracker
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class RingBuffer():
+    """
+    Single producer single consumer ring of fixed size event batches in
+    shared memory. Each slot holds a header and `batch` int64 keys followed by
+    `batch` int64 weights. The `free` and `filled` semaphores count the slots
+    owned by the producer and the consumer, so no event is ever copied through
+    a pipe.
+    """
+    def __init__(self, slots=8, batch=4096):
+        self.slots = slots
+        self.batch = batch
+        self.width = HEADER + 2 * batch
+        self.shm = shared_memory.SharedMemory(create=True, size=8 * slots * self.width)
+        self.free = mp.Semaphore(slots)
+        self.filled = mp.Semaphore(0)
+        self.attach()
+
+    def attach(self):
+        self.table = np.ndarray((self.slots, self.width), dtype=np.int64, buffer=self.shm.buf)
+        self.position = 0 # next slot, tracked separately by each side
+
+    def __getstate__(self):
+        return self.shm.name, self.slots, self.batch, self.free, self.filled
+
+    def __setstate__(self, state):
+        name, self.slots, self.batch, self.free, self.filled = state
+        self.width = HEADER + 2 * self.batch
+        self.shm = attach_shared(name)
+        self.attach()
+
+    def acquire(self):
+        # producer side: wait for a free slot and return its row
+        self.free.acquire()
+        row = self.table[self.position]
+        self.position = (self.position + 1) % self.slots
+        return row
+
+    def publish(self):
+        self.filled.release()
+
+    def consume(self):
+        # consumer side: wait for a filled slot and return its row
+        self.filled.acquire()
+        row = self.table[self.position]
+        self.position = (self.position + 1) % self.slots
+        return row
+
+    def release(self):
+        self.free.release()
+
+    def close(self, unlink=False):
+        del self.table
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def apply_batch(sketch, keys, weights):
+    if hasattr(sketch, "update_many"):
+        sketch.update_many(keys, weights)
+        return
+    if hasattr(sketch, "add_many"):
+        sketch.add_many(keys, weights)
+        return
+    # scalar updates take Python ints, NumPy scalars would end up in the sketch state
+    if isinstance(keys, np.ndarray):
+        keys = keys.tolist()
+    if isinstance(weights, np.ndarray):
+        weights = weights.tolist()
+    if hasattr(sketch, "add"):
+        for x, w in zip(keys, weights):
+            sketch.add(x, w)
+    else:
+        for x, w in zip(keys, weights):
+            sketch.update(x, w)
+
+def candidates(sketch):
+    # keys a sketch keeps track of, None if it only stores counters
+    if hasattr(sketch, "items"):
+        return [item for item, _, _ in sketch.items()]
+    if hasattr(sketch, "InsertSpacesaving"):
+        return [item for item, _, _ in sketch.InsertSpacesaving.items()]
+    if hasattr(sketch, "min_heap"):
+        return [item for item, _ in sketch.min_heap.items()]
+    return None
+
+def topk(sketch, k):
+    items = candidates(sketch)
+    if items is None:
+        raise ValueError("%s does not keep track of keys" % type(sketch).__name__)
+    return heapq.nlargest(k, ((item, sketch.query(item)) for item in items), key=itemgetter(1))
+
+def serve(sketch, request):
+    op, arg = request
+    if op == "query":
+        return sketch.query(arg)
+    if op == "topk":
+        return topk(sketch, arg)
+    if op == "sketch":
+        return sketch
+    raise ValueError("unknown request %r" % op)
+
+def worker(ring, conn, sketch, args, kwargs):
+    sketch = sketch(*args, **kwargs)
+    error = None
+    while True:
+        row = ring.consume()
+        n, op = int(row[0]), int(row[1])
+        if op == DATA:
+            keys = row[HEADER:HEADER + n].tolist()
+            weights = row[HEADER + ring.batch:HEADER + ring.batch + n].tolist()
+            ring.release()
+            if error is None:
+                try:
+                    apply_batch(sketch, keys, weights)
+                except Exception as e:
+                    error = e
+        elif op == CONTROL:
+            ring.release()
+            request = conn.recv()
+            if error is not None:
+                conn.send((False, error))
+                continue
+            try:
+                conn.send((True, serve(sketch, request)))
+            except Exception as e:
+                conn.send((False, e))
+        else:
+            ring.release()
+            break
+    del row
+    ring.close()
+    conn.close()
+
+
+class ShardedSketch():
+    """
+    Hash-partitions integer keys across `shards` worker processes, each of
+    which owns its own sketch(*args, **kwargs), e.g.
+        ShardedSketch(4, SpaceSaving, 1000)
+        ShardedSketch(4, CountMinSketch, 2048, 5)
+    Events are written straight into a shared-memory ring per worker and
+    handed over a batch at a time. Point queries go to the owning shard and
+    top-k queries gather the per-shard top-k. Since shards see disjoint keys,
+    every shard's error bound applies to its own share of the stream.
+    """
+    def __init__(self, shards, sketch, *args, batch=4096, slots=8, **kwargs):
+        self.shards = shards
+        self.batch = batch
+        self.rings = []
+        self.conns = []
+        self.workers = []
+        for _ in range(shards):
+            ring = RingBuffer(slots, batch)
+            parent_conn, child_conn = mp.Pipe()
+            p = mp.Process(target=worker, args=(ring, child_conn, sketch, args, kwargs), daemon=True)
+            p.start()
+            child_conn.close()
+            self.rings.append(ring)
+            self.conns.append(parent_conn)
+            self.workers.append(p)
+        self.rows = [None] * shards # slot being filled for each shard
+        self.fill = [0] * shards
+        self.closed = False
+
+    def row(self, shard):
+        if self.rows[shard] is None:
+            self.rows[shard] = self.rings[shard].acquire()
+            self.fill[shard] = 0
+        return self.rows[shard]
+
+    def ship(self, shard, op=DATA):
+        row = self.row(shard)
+        row[0] = self.fill[shard]
+        row[1] = op
+        self.rows[shard] = None
+        self.rings[shard].publish()
+
+    def update(self, x, weight=1):
+        shard = owner(x, self.shards)
+        row = self.row(shard)
+        n = self.fill[shard]
+        row[HEADER + n] = x
+        row[HEADER + self.batch + n] = weight
+        self.fill[shard] = n + 1
+        if n + 1 == self.batch:
+            self.ship(shard)
+
+    def update_many(self, keys, weights=None):
+        keys = np.asarray(keys, dtype=np.int64)
+        if weights is None:
+            weights = np.ones(len(keys), dtype=np.int64)
+        else:
+            weights = np.asarray(weights, dtype=np.int64)
+        shard_of = owners(keys, self.shards)
+        order = np.argsort(shard_of, kind="stable")
+        bounds = np.searchsorted(shard_of[order], np.arange(self.shards + 1))
+        for shard in range(self.shards):
+            start, end = bounds[shard], bounds[shard + 1]
+            while start < end:
+                row = self.row(shard)
+                n = self.fill[shard]
+                take = min(self.batch - n, end - start)
+                index = order[start:start + take]
+                row[HEADER + n:HEADER + n + take] = keys[index]
+                row[HEADER + self.batch + n:HEADER + self.batch + n + take] = weights[index]
+                self.fill[shard] = n + take
+                start += take
+                if self.fill[shard] == self.batch:
+                    self.ship(shard)
+
+    def flush(self, shard=None):
+        for s in range(self.shards) if shard is None else [shard]:
+            if self.rows[s] is not None:
+                self.ship(s)
+
+    def request(self, shard, op, arg=None):
+        # control slots travel through the ring, so all earlier events are applied first
+        self.flush(shard)
+        self.ship(shard, CONTROL)
+        self.conns[shard].send((op, arg))
+        ok, result = self.conns[shard].recv()
+        if not ok:
+            raise result
+        return result
+
+    def query(self, x):
+        return self.request(owner(x, self.shards), "query", x)
+
+    def __getitem__(self, x):
+        return self.query(x)
+
+    def topk(self, k):
+        results = []
+        for shard in range(self.shards):
+            results.extend(self.request(shard, "topk", k))
+        return heapq.nlargest(k, results, key=itemgetter(1))
+
+    def sketches(self):
+        # copies of the per-shard sketches, e.g. for spacesaving.merge_all
+        return [self.request(shard, "sketch") for shard in range(self.shards)]
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.flush()
+        for shard in range(self.shards):
+            self.ship(shard, STOP)
+        for p, ring, conn in zip(self.workers, self.rings, self.conns):
+            p.join()
+            conn.close()
+            ring.close(unlink=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
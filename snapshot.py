@@ -0,0 +1,332 @@
+"""
+Compact binary snapshots of the sketches.
+
+A snapshot is
+    8 bytes magic, uint32 version, uint32 header length, JSON header,
+followed by the raw little-endian counter arrays, each aligned to 64 bytes.
+The header records the sketch class, its scalar parameters, nested sketches
+and the dtype, shape and offset of every array, so loading never parses the
+counters themselves. With load(path, mmap=True) the arrays are read-only
+views of the mapped file, which lets a query-only process open a large
+snapshot without reading it.
+"""
+import array
+import json
+import mmap as _mmap
+import struct
+from collections import defaultdict, deque
+import numpy as np
+
+from spacesaving import SpaceSaving, IntSpaceSaving, StreamSummary, DoubleSpaceSaving, WindowedSpaceSaving, CountIndex
+from unbiasedSpaceSaving import UnbiasedSpaceSaving, UnbiasedDSS
+from githubCountMin import CountMinSketch, VectorizedCountMinSketch
+from CSSS import CSSS_CountSketch, CSSS_sketch
+from Panakos import Panakos
+from HeavyKeeper import HeavyKeeper, heavykeeper_minheap, ssummary
+from hhh import HierarchicalHeavyHitters, MASK32
+from rng import BufferedRandom
+
+MAGIC = b"SSBDSNAP"
+VERSION = 2 # 2 adds the state of the buffered uniforms
+ALIGN = 64
+PREAMBLE = struct.Struct("<8sII")
+
+
+def align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+# --- key tables ---
+
+def pack_keys(keys):
+    # returns the key kind and the arrays holding the keys
+    if all(type(x) is int for x in keys):
+        return "int", {"keys": np.array(keys, dtype="<i8")}
+    if all(type(x) is str for x in keys):
+        kind, blobs = "str", [x.encode("utf-8") for x in keys]
+    elif all(type(x) is bytes for x in keys):
+        kind, blobs = "bytes", keys
+    else:
+        raise TypeError("keys must be all int, all str or all bytes")
+    offsets = np.zeros(len(blobs) + 1, dtype="<i8")
+    offsets[1:] = np.cumsum([len(b) for b in blobs])
+    return kind, {"keys": np.frombuffer(b"".join(blobs), dtype=np.uint8), "key_offsets": offsets}
+
+def unpack_keys(kind, arrays):
+    if kind == "int":
+        return arrays["keys"].tolist()
+    blob = arrays["keys"].tobytes()
+    offsets = arrays["key_offsets"].tolist()
+    keys = [blob[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+    if kind == "str":
+        keys = [x.decode("utf-8") for x in keys]
+    return keys
+
+def key_table(fields, arrays, keys):
+    fields["key_kind"], packed = pack_keys(keys)
+    arrays.update(packed)
+
+def buffered_random(fields, seed):
+    # version 1 snapshots carry no state for the uniforms, start them from the seed
+    if "rng" in fields:
+        return BufferedRandom.restore(fields["rng"])
+    return BufferedRandom(seed)
+
+def generator(state):
+    # np.random.Generator restored from its bit generator state
+    rng = np.random.default_rng()
+    rng.bit_generator.state = state
+    return rng
+
+# --- per class codecs ---
+# encoders return (scalar fields, arrays, nested sketches); decode() sets the
+# fields and nested sketches, decoders rebuild the rest from the arrays
+
+def encode_spacesaving(s):
+    entries = list(s.items())
+    fields = {"k": s.k, "size": s.size, "total_items": s.total_items}
+    arrays = {"counters": np.array([[i, d] for _, i, d in entries], dtype="<i8").reshape(-1, 2)}
+    key_table(fields, arrays, [x for x, _, _ in entries])
+    return fields, arrays, {}
+
+def stored_entries(fields, arrays):
+    keys = unpack_keys(fields["key_kind"], arrays)
+    return [[x, i, d] for x, (i, d) in zip(keys, arrays["counters"].tolist())]
+
+def decode_spacesaving(s, fields, arrays, mapped):
+    s.rebuild(stored_entries(fields, arrays))
+
+def decode_heap(s, fields, arrays, mapped):
+    # stored in heap order, restoring it keeps min replacement ties as they were
+    s.rebuild(stored_entries(fields, arrays), heap=True)
+
+def encode_unbiased(s):
+    fields = {"k": s.k, "size": s.size, "total_items": s.total_items, "rng": s.rng.state()}
+    arrays = {"counts": np.array([c for _, c in s.weight_heap], dtype="<i8")}
+    key_table(fields, arrays, [x for x, _ in s.weight_heap])
+    return fields, arrays, {}
+
+def decode_unbiased(s, fields, arrays, mapped):
+    keys = unpack_keys(fields["key_kind"], arrays)
+    # stored in heap order, so the heap is valid as is
+    s.weight_heap = [[x, c] for x, c in zip(keys, arrays["counts"].tolist())]
+    s.item_to_indices = defaultdict(int)
+    for index, x in enumerate(keys):
+        s.item_to_indices[x] = index
+    s.rng = buffered_random(fields, 0)
+
+def encode_dss(s):
+    return {}, {}, {"InsertSpacesaving": s.InsertSpacesaving, "DeleteSpacesaving": s.DeleteSpacesaving}
+
+def encode_windowed(s):
+    fields = {"eps": s.eps, "spacebudget": s.spacebudget, "epoch_length": s.epoch_length, "epoch_items": s.epoch_items,
+              "summary": s.summary.__name__, "window": s.epochs.maxlen, "count": len(s.epochs)}
+    return fields, {}, {"epoch%d" % i: epoch for i, epoch in enumerate(s.epochs)}
+
+def decode_windowed(s, fields, arrays, mapped):
+    # the epochs were restored as attributes epoch0, epoch1, ...
+    s.epochs = deque((s.__dict__.pop("epoch%d" % i) for i in range(fields["count"])), maxlen=fields["window"])
+    s.summary = CLASSES[fields["summary"]]
+    del s.window, s.count
+
+def encode_udss(s):
+    return {}, {}, {"insertUSS": s.insertUSS, "deleteUSS": s.deleteUSS}
+
+def encode_hhh(s):
+    fields = {"k": s.k, "lengths": s.lengths, "total_items": s.total_items}
+    return fields, {}, {"level%d" % length: level for length, level in zip(s.lengths, s.levels)}
+
+def decode_hhh(s, fields, arrays, mapped):
+    # the levels were restored as attributes level8, level16, ...
+    s.levels = [s.__dict__.pop("level%d" % length) for length in s.lengths]
+    s.masks = [MASK32 << (32 - length) & MASK32 for length in s.lengths]
+
+def encode_countmin(s):
+    tables = np.array([np.frombuffer(t, dtype=np.int32) for t in s.tables], dtype="<i4")
+    return {"m": s.m, "d": s.d, "n": s.n, "seed": s.seed}, {"tables": tables}, {}
+
+def decode_countmin(s, fields, arrays, mapped):
+    if mapped:
+        s.tables = list(arrays["tables"])
+    else:
+        s.tables = [array.array("i", row.tobytes()) for row in arrays["tables"]]
+
+def encode_vectorized_countmin(s):
+    fields = {"m": s.m, "d": s.d, "n": s.n, "seed": s.seed}
+    return fields, {"tables": s.tables}, {}
+
+def decode_vectorized_countmin(s, fields, arrays, mapped):
+    s.tables = arrays["tables"]
+    s.rows = np.arange(s.d)[:, None]
+
+def encode_count_sketch(s):
+    fields = {"total_input": s.total_input, "columns": s.columns, "rows": s.rows, "prime": int(s.prime), "rng": s.rng.bit_generator.state}
+    arrays = {
+        "table_positive": s.table_positive,
+        "table_negative": s.table_negative,
+        "hash_params": np.array([s.a, s.b, s.c, s.d], dtype="<i8"),
+    }
+    return fields, arrays, {}
+
+def decode_count_sketch(s, fields, arrays, mapped):
+    s.table_positive = arrays["table_positive"]
+    s.table_negative = arrays["table_negative"]
+    s.a, s.b, s.c, s.d = arrays["hash_params"].tolist()
+    s.rng = generator(fields["rng"])
+
+CSSS_FIELDS = ("alpha", "epsilon", "universe", "T", "S", "d", "multiple", "k", "r", "p", "time", "samples", "total_input")
+
+def encode_csss(s):
+    return {name: getattr(s, name) for name in CSSS_FIELDS}, {}, {"count_sketch": s.count_sketch}
+
+def encode_panakos(s):
+    fields = {"bitmapLen": s.bitmapLen, "countMinColumns": s.countMinColumns, "countMinRows": s.countMinRows, "T": s.T, "seed": s.seed}
+    arrays = {"bitmap": s.bitmap, "bitmap_morethanonce": s.bitmap_morethanonce}
+    return fields, arrays, {"CountMin": s.CountMin, "SpaceSaving": s.SpaceSaving}
+
+def decode_panakos(s, fields, arrays, mapped):
+    s.bitmap = arrays["bitmap"]
+    s.bitmap_morethanonce = arrays["bitmap_morethanonce"]
+    s.derive()
+
+def encode_heavykeeper(s):
+    fields = {"HK_b": s.HK_b, "K": s.K, "M2": s.M2, "depth": s.depth, "width": s.width, "seed": s.seed, "rng": s.rng.state()}
+    arrays = {"fingerprints": s.fingerprints, "counts": s.counts}
+    return fields, arrays, {"min_heap": s.min_heap}
+
+def decode_heavykeeper(s, fields, arrays, mapped):
+    s.fingerprints = arrays["fingerprints"]
+    s.counts = arrays["counts"]
+    s.rng = buffered_random(fields, s.seed)
+    s.derive()
+
+def encode_minheap(s):
+    fields = {"k": s.k}
+    arrays = {"weights": np.array([w for _, w in s.heap], dtype="<i8")}
+    key_table(fields, arrays, [x for x, _ in s.heap])
+    return fields, arrays, {}
+
+def decode_minheap(s, fields, arrays, mapped):
+    keys = unpack_keys(fields["key_kind"], arrays)
+    s.heap = [[x, w] for x, w in zip(keys, arrays["weights"].tolist())]
+    s.pos = {x: index for index, x in enumerate(keys)}
+
+def encode_ssummary(s):
+    entries = list(s.items())
+    fields = {"k": s.k}
+    arrays = {"weights": np.array([w for _, w in entries], dtype="<i8")}
+    key_table(fields, arrays, [x for x, _ in entries])
+    return fields, arrays, {}
+
+def decode_ssummary(s, fields, arrays, mapped):
+    s.index = CountIndex()
+    keys = unpack_keys(fields["key_kind"], arrays)
+    for x, w in zip(keys, arrays["weights"].tolist()):
+        s.update(x, w)
+
+def no_arrays(s, fields, arrays, mapped):
+    # scalars and nested sketches are restored by decode()
+    pass
+
+# class -> (encoder, decoder)
+CODECS = {
+    SpaceSaving: (encode_spacesaving, decode_heap),
+    IntSpaceSaving: (encode_spacesaving, decode_heap),
+    StreamSummary: (encode_spacesaving, decode_spacesaving),
+    UnbiasedSpaceSaving: (encode_unbiased, decode_unbiased),
+    DoubleSpaceSaving: (encode_dss, no_arrays),
+    WindowedSpaceSaving: (encode_windowed, decode_windowed),
+    UnbiasedDSS: (encode_udss, no_arrays),
+    CountMinSketch: (encode_countmin, decode_countmin),
+    VectorizedCountMinSketch: (encode_vectorized_countmin, decode_vectorized_countmin),
+    CSSS_CountSketch: (encode_count_sketch, decode_count_sketch),
+    CSSS_sketch: (encode_csss, no_arrays),
+    Panakos: (encode_panakos, decode_panakos),
+    HeavyKeeper: (encode_heavykeeper, decode_heavykeeper),
+    heavykeeper_minheap: (encode_minheap, decode_minheap),
+    ssummary: (encode_ssummary, decode_ssummary),
+    HierarchicalHeavyHitters: (encode_hhh, decode_hhh),
+}
+CLASSES = {cls.__name__: cls for cls in CODECS}
+
+# --- file layout ---
+
+def plain(value):
+    # header fields as JSON-ready Python scalars, counters fed NumPy scalars hold np.int64
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {name: plain(v) for name, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    return value
+
+def encode(sketch, blobs):
+    cls = type(sketch)
+    if cls not in CODECS:
+        raise TypeError("cannot snapshot %s" % cls.__name__)
+    fields, arrays, children = CODECS[cls][0](sketch)
+    layout = {}
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        offset = align(sum(len(b) for b in blobs)) if blobs else 0
+        padding = offset - sum(len(b) for b in blobs)
+        if padding:
+            blobs.append(b"\0" * padding)
+        blobs.append(arr.tobytes())
+        layout[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+    return {
+        "class": cls.__name__,
+        "fields": plain(fields),
+        "arrays": layout,
+        "children": {name: encode(child, blobs) for name, child in children.items()},
+    }
+
+def decode(node, buf, base, mapped):
+    cls = CLASSES[node["class"]]
+    sketch = cls.__new__(cls)
+    arrays = {}
+    for name, spec in node["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        arr = np.frombuffer(buf, dtype=dtype, count=count, offset=base + spec["offset"]).reshape(spec["shape"])
+        arrays[name] = arr if mapped else arr.copy()
+    children = {name: decode(child, buf, base, mapped) for name, child in node["children"].items()}
+    for name, value in node["fields"].items():
+        if name != "key_kind":
+            setattr(sketch, name, value)
+    for name, child in children.items():
+        setattr(sketch, name, child)
+    CODECS[cls][1](sketch, node["fields"], arrays, mapped)
+    return sketch
+
+def dump(sketch, path):
+    """
+    Write `sketch` to `path` as a binary snapshot.
+    """
+    blobs = []
+    header = json.dumps(encode(sketch, blobs)).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        f.write(b"\0" * (align(PREAMBLE.size + len(header)) - PREAMBLE.size - len(header)))
+        for blob in blobs:
+            f.write(blob)
+
+def load(path, mmap=False):
+    """
+    Read a snapshot written by `dump`. With `mmap=True` the counter arrays
+    stay in the mapped file and are read-only, so the result is meant for
+    queries only.
+    """
+    with open(path, "rb") as f:
+        if mmap:
+            buf = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+        else:
+            buf = f.read()
+    magic, version, header_len = PREAMBLE.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError("%s is not a sketch snapshot" % path)
+    if version not in (1, VERSION):
+        raise ValueError("unsupported snapshot version %d" % version)
+    node = json.loads(bytes(buf[PREAMBLE.size:PREAMBLE.size + header_len]).decode("utf-8"))
+    return decode(node, buf, align(PREAMBLE.size + header_len), mmap)
@@ -1,10 +1,243 @@
-from collections import defaultdict
+from collections import defaultdict, Counter, deque
+from operator import itemgetter
+import heapq
+import copy
+from array import array
+import numpy as np
+from hashing import MASK64, GOLDEN
+
+def aggregate(keys, weights=None):
+    """
+    Collapse a batch of (key, weight) updates into per-key insert and delete
+    totals. Without weights every key counts as a unit insert. NumPy
+    batches are converted first, so the summaries hold Python ints.
+    """
+    if isinstance(keys, np.ndarray):
+        keys = keys.tolist()
+    if isinstance(weights, np.ndarray):
+        weights = weights.tolist()
+    if weights is None:
+        return Counter(keys), {}
+    inserts = defaultdict(int)
+    deletes = defaultdict(int)
+    for x, w in zip(keys, weights):
+        if w > 0:
+            inserts[x] += w
+        elif w < 0:
+            deletes[x] -= w
+    return inserts, deletes
+
+def merged_counters(summaries, k):
+    """
+    Combine SpaceSaving± summaries into the k entries [item, insert count,
+    delete count] with the largest insert counts. An item missing from a full
+    summary may have been inserted up to that summary's minimum insert count
+    there, so it is charged that minimum: insert counts stay overestimates
+    (by at most the sum of the minima, i.e. I/k for the combined stream),
+    delete counts stay underestimates, and every dropped item has at most the
+    new minimum insert count.
+    """
+    base = 0
+    charges = []
+    for summary in summaries:
+        charge = summary.getmininsert() if summary.isFull() else 0
+        base += charge
+        charges.append(charge)
+    inserts = defaultdict(int)
+    deletes = defaultdict(int)
+    for summary, charge in zip(summaries, charges):
+        for item, insert, delete in summary.items():
+            inserts[item] += insert - charge
+            deletes[item] += delete
+    top = heapq.nlargest(k, inserts.items(), key=itemgetter(1))
+    return [[item, base + insert, deletes[item]] for item, insert in top]
+
+def merge_all(summaries):
+    """
+    k-way merge: return a new summary of the type and size of the first one
+    that covers all the input streams. The inputs are left untouched.
+    """
+    merged = copy.deepcopy(summaries[0])
+    merged.merge(*summaries[1:])
+    return merged
+
+class Bucket():
+    # all items that share one count
+    __slots__ = ('count', 'items', 'prev', 'next')
+    def __init__(self, count):
+        self.count = count
+        self.items = {} # used as an ordered set, the values are unused
+        self.prev = None
+        self.next = None
+
+
+class CountIndex():
+    """
+    Items bucketed by an integer count, with the buckets in a doubly linked
+    list in increasing count order. Moving an item to a neighbouring count,
+    reading the min or the max, and popping a min item are O(1); larger
+    moves walk over the counts in between.
+    """
+    def __init__(self):
+        self.min_bucket = None
+        self.max_bucket = None
+        self.item_to_bucket = {}
+
+    def __len__(self):
+        return len(self.item_to_bucket)
+
+    def __contains__(self, item):
+        return item in self.item_to_bucket
+
+    def count(self, item):
+        return self.item_to_bucket[item].count
+
+    def getmin(self):
+        return self.min_bucket.count
+
+    def getmax(self):
+        return self.max_bucket.count
+
+    def set(self, item, count):
+        bucket = self.item_to_bucket.get(item)
+        if bucket is None:
+            prev, nxt = None, self.min_bucket
+        elif count == bucket.count:
+            return
+        elif count > bucket.count:
+            prev, nxt = bucket, bucket.next
+        else:
+            prev, nxt = bucket.prev, bucket
+        while nxt is not None and nxt.count < count:
+            prev, nxt = nxt, nxt.next
+        while prev is not None and prev.count > count:
+            prev, nxt = prev.prev, prev
+        if nxt is not None and nxt.count == count:
+            target = nxt
+        elif prev is not None and prev.count == count:
+            target = prev
+        else:
+            target = Bucket(count)
+            target.prev = prev
+            target.next = nxt
+            if prev is None:
+                self.min_bucket = target
+            else:
+                prev.next = target
+            if nxt is None:
+                self.max_bucket = target
+            else:
+                nxt.prev = target
+        target.items[item] = 0
+        self.item_to_bucket[item] = target
+        if bucket is not None:
+            del bucket.items[item]
+            if not bucket.items:
+                self.unlink(bucket)
+
+    def remove(self, item):
+        bucket = self.item_to_bucket.pop(item)
+        del bucket.items[item]
+        if not bucket.items:
+            self.unlink(bucket)
+
+    def popmin(self):
+        bucket = self.min_bucket
+        item, _ = bucket.items.popitem()
+        del self.item_to_bucket[item]
+        if not bucket.items:
+            self.unlink(bucket)
+        return item
+
+    def unlink(self, bucket):
+        if bucket.prev is None:
+            self.min_bucket = bucket.next
+        else:
+            bucket.prev.next = bucket.next
+        if bucket.next is None:
+            self.max_bucket = bucket.prev
+        else:
+            bucket.next.prev = bucket.prev
+
+    def __getstate__(self):
+        # flat (item, count) pairs, pickle and deepcopy would otherwise
+        # recurse along the whole bucket chain
+        return (list(self.ascending()),)
+
+    def __setstate__(self, state):
+        self.__init__()
+        bucket = None
+        for item, count in state[0]:
+            if bucket is None or bucket.count != count:
+                nxt = Bucket(count)
+                nxt.prev = bucket
+                if bucket is None:
+                    self.min_bucket = nxt
+                else:
+                    bucket.next = nxt
+                bucket = nxt
+            bucket.items[item] = 0
+            self.item_to_bucket[item] = bucket
+        self.max_bucket = bucket
+
+    def ascending(self):
+        bucket = self.min_bucket
+        while bucket is not None:
+            for item in bucket.items:
+                yield item, bucket.count
+            bucket = bucket.next
+
+    def descending(self):
+        bucket = self.max_bucket
+        while bucket is not None:
+            for item in bucket.items:
+                yield item, bucket.count
+            bucket = bucket.prev
+
+
+def topk(summary, n):
+    """
+    The n items with the largest estimates as (item, lower, upper) bounds on
+    their true count, walking the net count index from the top. Estimates
+    never underestimate, and overestimate by at most the insert count the
+    item inherited when it was admitted, which is at most the current
+    minimum insert count.
+    """
+    error = summary.getmininsert() if summary.isFull() else 0
+    result = []
+    for item, estimate in summary.net.descending():
+        if len(result) == n:
+            break
+        result.append((item, max(0, estimate - error), estimate))
+    return result
+
+def heavy_hitters(summary, phi):
+    """
+    Every item whose upper bound reaches phi * (inserts - deletes), as
+    (item, lower, upper). The ones whose lower bound also reaches the
+    threshold are certain. No true phi-heavy hitter is missed as long as
+    the minimum insert count stays below the threshold, which holds on an
+    alpha-bounded deletion stream (inserts <= alpha * (inserts - deletes))
+    when k > alpha / phi; with fewer counters an unmonitored item may
+    reach the threshold.
+    """
+    threshold = phi * summary.total_items
+    error = summary.getmininsert() if summary.isFull() else 0
+    result = []
+    for item, estimate in summary.net.descending():
+        if estimate < threshold:
+            break
+        result.append((item, max(0, estimate - error), estimate))
+    return result
+
+
 class SpaceSaving():
     def __init__(self, k=100):
         self.k = k
         self.size = 0
         self.weight_heap = [] # Min heap
         self.item_to_indices = defaultdict(int)
+        self.net = CountIndex() # items by insert - delete count
         self.total_items = 0
     
     def parent(self, i):
@@ -46,6 +279,7 @@ class SpaceSaving():
         assert(len(arr) < self.k)
 
         arr.append([item, val, 0]) # item, insert count, delete count
+        self.net.set(item, val)
 
         index = len(arr) - 1
         while index!=0 and arr[self.parent(index)][1] > arr[index][1]:
@@ -54,7 +288,6 @@ class SpaceSaving():
             
     def updateMonitored(self, item, delta_val):
         assert item in self.item_to_indices
-        assert delta_val in {1, -1}
 
         index = 0
         arr = self.weight_heap
@@ -63,10 +296,11 @@ class SpaceSaving():
         assert self.weight_heap[index][0] == item
         
         prev_val = arr[index][1]
-        if delta_val == 1: 
-            arr[index][1] += 1
+        if delta_val > 0: 
+            arr[index][1] += delta_val
         else:
-            arr[index][2] += 1
+            arr[index][2] -= delta_val
+        self.net.set(item, arr[index][1] - arr[index][2])
 
         new_val = arr[index][1]
         
@@ -91,6 +325,8 @@ class SpaceSaving():
         
         
     def update(self, x, val):
+        if val == 0:
+            return
         self.total_items += val
         if x in self.item_to_indices:
             weight_index = self.item_to_indices[x]
@@ -115,8 +351,20 @@ class SpaceSaving():
                     self.weight_heap[weight_index][2] = 0 # reset delete count
                     del self.item_to_indices[min_item]
                     self.item_to_indices[x] = weight_index
-                        
-                    
+                    self.net.remove(min_item)
+                    self.net.set(x, self.weight_heap[weight_index][1])
+
+    def update_many(self, keys, weights=None):
+        """
+        Apply a batch of updates. The batch is collapsed into per-key insert
+        and delete totals first, so every distinct key touches the heap at
+        most twice. Inserts are applied before deletes.
+        """
+        inserts, deletes = aggregate(keys, weights)
+        for x, val in inserts.items():
+            self.update(x, val)
+        for x, val in deletes.items():
+            self.update(x, -val)
               
     def query(self, x):
         """
@@ -133,10 +381,44 @@ class SpaceSaving():
         return False
 
     def getmin(self):
-        global_min = float('inf')
-        for _, insert, delete in self.weight_heap:
-            global_min = min(global_min, insert-delete)
-        return global_min 
+        # smallest insert - delete count, from the net count index
+        if not self.net:
+            return float('inf')
+        return self.net.getmin()
+
+    def topk(self, n):
+        return topk(self, n)
+
+    def heavy_hitters(self, phi):
+        return heavy_hitters(self, phi)
+
+    def getmininsert(self):
+        return self.weight_heap[0][1] if self.weight_heap else 0
+
+    def items(self):
+        # (item, insert count, delete count) of every monitored item
+        for item, insert, delete in self.weight_heap:
+            yield item, insert, delete
+
+    def rebuild(self, entries, heap=False):
+        # entries sorted by insert count already form a valid min heap; with
+        # heap=True they are in heap order (as items() yields them) and kept as is
+        self.weight_heap = list(entries) if heap else sorted(entries, key=itemgetter(1))
+        self.item_to_indices = defaultdict(int)
+        self.net = CountIndex()
+        for index, entry in enumerate(self.weight_heap):
+            self.item_to_indices[entry[0]] = index
+            self.net.set(entry[0], entry[1] - entry[2])
+        self.size = len(self.weight_heap)
+
+    def merge(self, *others):
+        """
+        Merge other SpaceSaving± summaries into this one, keeping k counters.
+        """
+        summaries = [self] + list(others)
+        self.rebuild(merged_counters(summaries, self.k))
+        self.total_items = sum(summary.total_items for summary in summaries)
+        return self
 
     def __getitem__(self, x):
         """
@@ -144,6 +426,10 @@ class SpaceSaving():
         """
         return self.query(x)
     
+    def freeze(self):
+        # immutable copy of the counters for concurrent readers
+        return SummaryView(self)
+
     def space(self):
         return self.k
     
@@ -152,19 +438,546 @@ class SpaceSaving():
         print("map: ", self.item_to_indices)
 
 
-# maybe should try the linked list implementation.
+class IntSpaceSaving():
+    """
+    SpaceSaving± for integer keys (int64) in struct-of-arrays form. Position i
+    of the min heap on insert counts is slot i of the parallel buffers keys,
+    inserts and deletes, and keys are found through a linear probing table
+    of slot + 1 entries (0 marks an empty cell) kept at most half full, with
+    `cells` pointing back from each slot to its table cell. That is about 36
+    bytes per monitored item and no per-item Python objects.
+    """
+    def __init__(self, k=100):
+        self.k = k
+        self.size = 0
+        self.total_items = 0
+        self.allocate()
+
+    def allocate(self):
+        k = self.k
+        self.keys = array('q', bytes(8 * k))
+        self.inserts = array('q', bytes(8 * k))
+        self.deletes = array('q', bytes(8 * k))
+        self.cells = array('i', bytes(4 * k))
+        bits = max(1, (2 * k - 1).bit_length())
+        self.shift = 64 - bits
+        self.mask = (1 << bits) - 1
+        self.table = array('i', bytes(4 << bits))
+
+    def isFull(self):
+        return self.size == self.k
+    def isEmpty(self):
+        return self.size==0
+
+    # --- hash table ---
+
+    def home(self, x):
+        # fibonacci hashing on the top bits
+        return ((x & MASK64) * GOLDEN & MASK64) >> self.shift
+
+    def cell(self, x):
+        # the cell holding x, or the empty cell where x belongs
+        table, keys, mask = self.table, self.keys, self.mask
+        x = int(x)
+        i = self.home(x)
+        while True:
+            slot = table[i]
+            if slot == 0 or keys[slot - 1] == x:
+                return i
+            i = (i + 1) & mask
+
+    def vacate(self, i):
+        # empty cell i, shifting back the entries of its probe run
+        table, keys, cells, mask = self.table, self.keys, self.cells, self.mask
+        j = i
+        while True:
+            j = (j + 1) & mask
+            slot = table[j]
+            if slot == 0:
+                break
+            h = self.home(keys[slot - 1])
+            # the entry at j may move to i unless its home lies cyclically in (i, j]
+            if (i <= j and (h <= i or h > j)) or (i > j and h <= i and h > j):
+                table[i] = slot
+                cells[slot - 1] = i
+                i = j
+        table[i] = 0
+
+    # --- heap on insert counts ---
+
+    def swap(self, a, b):
+        keys, inserts, deletes, cells = self.keys, self.inserts, self.deletes, self.cells
+        keys[a], keys[b] = keys[b], keys[a]
+        inserts[a], inserts[b] = inserts[b], inserts[a]
+        deletes[a], deletes[b] = deletes[b], deletes[a]
+        cells[a], cells[b] = cells[b], cells[a]
+        self.table[cells[a]] = a + 1
+        self.table[cells[b]] = b + 1
+
+    def siftUp(self, index):
+        inserts = self.inserts
+        while index != 0 and inserts[(index - 1) // 2] > inserts[index]:
+            self.swap((index - 1) // 2, index)
+            index = (index - 1) // 2
+
+    def siftDown(self, index):
+        inserts, size = self.inserts, self.size
+        while 2 * index + 1 < size:
+            child = 2 * index + 1
+            if child + 1 < size and inserts[child + 1] < inserts[child]:
+                child += 1
+            if inserts[index] <= inserts[child]:
+                return
+            self.swap(index, child)
+            index = child
+
+    def update(self, x, val):
+        if val == 0:
+            return
+        self.total_items += val
+        i = self.cell(x)
+        slot = self.table[i]
+        if slot:
+            slot -= 1
+            if val > 0:
+                self.inserts[slot] += val
+                self.siftDown(slot)
+            else:
+                self.deletes[slot] -= val
+        elif self.size < self.k:
+            assert val > 0
+            slot = self.size
+            self.size += 1
+            self.keys[slot] = x
+            self.inserts[slot] = val
+            self.deletes[slot] = 0
+            self.cells[slot] = i
+            self.table[i] = slot + 1
+            self.siftUp(slot)
+        elif val > 0:
+            # replace min: x inherits its insert count, the delete count restarts
+            self.vacate(self.cells[0])
+            i = self.cell(x)
+            self.keys[0] = x
+            self.inserts[0] += val
+            self.deletes[0] = 0
+            self.cells[0] = i
+            self.table[i] = 1
+            self.siftDown(0)
+
+    def update_many(self, keys, weights=None):
+        """
+        Apply a batch of updates. The batch is reduced to per-key insert and
+        delete totals with NumPy, then inserts are applied before deletes,
+        as in SpaceSaving.update_many.
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        if weights is None:
+            weights = np.ones(len(keys), dtype=np.int64)
+        else:
+            weights = np.asarray(weights, dtype=np.int64)
+        for sign in (1, -1):
+            selected = sign * weights > 0
+            unique, inverse = np.unique(keys[selected], return_inverse=True)
+            totals = np.zeros(len(unique), dtype=np.int64)
+            np.add.at(totals, inverse, weights[selected])
+            for x, val in zip(unique.tolist(), totals.tolist()):
+                self.update(x, val)
+
+    def query(self, x):
+        """
+        Return an estimation of the amount of times `x` has ocurred.
+        """
+        slot = self.table[self.cell(x)]
+        if slot:
+            return self.inserts[slot - 1] - self.deletes[slot - 1]
+        return 0
+
+    def query_many(self, keys):
+        return np.fromiter((self.query(x) for x in np.asarray(keys).tolist()), dtype=np.int64, count=len(keys))
+
+    def find(self, x):
+        return self.table[self.cell(x)] != 0
+
+    def net(self):
+        # keys and insert - delete counts of the monitored items, as arrays
+        size = self.size
+        keys = np.frombuffer(self.keys, dtype=np.int64, count=size)
+        inserts = np.frombuffer(self.inserts, dtype=np.int64, count=size)
+        deletes = np.frombuffer(self.deletes, dtype=np.int64, count=size)
+        return keys, inserts - deletes
+
+    def getmin(self):
+        if not self.size:
+            return float('inf')
+        return int(self.net()[1].min())
+
+    def getmininsert(self):
+        return self.inserts[0] if self.size else 0
+
+    def ranked(self, n=None, threshold=None):
+        # (item, lower, upper) by decreasing estimate, like the module level topk
+        keys, net = self.net()
+        order = np.argsort(-net, kind="stable")
+        if threshold is not None:
+            order = order[net[order] >= threshold]
+        error = self.getmininsert() if self.isFull() else 0
+        return [(x, max(0, estimate - error), estimate) for x, estimate in zip(keys[order[:n]].tolist(), net[order[:n]].tolist())]
+
+    def topk(self, n):
+        return self.ranked(n=n)
+
+    def heavy_hitters(self, phi):
+        return self.ranked(threshold=phi * self.total_items)
+
+    def items(self):
+        # (item, insert count, delete count) of every monitored item
+        for i in range(self.size):
+            yield self.keys[i], self.inserts[i], self.deletes[i]
+
+    def rebuild(self, entries, heap=False):
+        # entries sorted by insert count already form a valid min heap, heap=True as in SpaceSaving
+        self.allocate()
+        self.size = len(entries)
+        for slot, (x, insert, delete) in enumerate(entries if heap else sorted(entries, key=itemgetter(1))):
+            i = self.cell(x)
+            self.keys[slot] = x
+            self.inserts[slot] = insert
+            self.deletes[slot] = delete
+            self.cells[slot] = i
+            self.table[i] = slot + 1
+
+    def merge(self, *others):
+        """
+        Merge other SpaceSaving± summaries into this one, keeping k counters.
+        """
+        summaries = [self] + list(others)
+        self.rebuild(merged_counters(summaries, self.k))
+        self.total_items = sum(summary.total_items for summary in summaries)
+        return self
+
+    def __getitem__(self, x):
+        return self.query(x)
+
+    def freeze(self):
+        # immutable copy of the counters for concurrent readers
+        return SummaryView(self)
+
+    def space(self):
+        return self.k
+
+
+class StreamSummary():
+    """
+    SpaceSaving± on the stream-summary structure of the original SpaceSaving
+    paper: monitored items bucketed by insert count in a CountIndex, so a
+    unit insert, a delete and a min replacement are O(1) instead of a heap
+    sift.
+    """
+    def __init__(self, k=100):
+        self.k = k
+        self.size = 0
+        self.inserts = CountIndex() # items by insert count
+        self.deletes = {} # item -> delete count
+        self.net = CountIndex() # items by insert - delete count
+        self.total_items = 0
+
+    def isFull(self):
+        return self.size == self.k
+    def isEmpty(self):
+        return self.size==0
+
+    def insertUnmonitored(self, item, val):
+        assert val > 0
+        assert len(self.inserts) < self.k
+
+        self.inserts.set(item, val)
+        self.deletes[item] = 0
+        self.net.set(item, val)
+
+    def updateMonitored(self, item, delta_val):
+        assert item in self.inserts
+
+        if delta_val < 0:
+            self.deletes[item] -= delta_val
+        else:
+            self.inserts.set(item, self.inserts.count(item) + delta_val)
+        self.net.set(item, self.inserts.count(item) - self.deletes[item])
+
+    def update(self, x, val):
+        if val == 0:
+            return
+        self.total_items += val
+        if x in self.inserts:
+            self.updateMonitored(x, val)
+        else:
+            if self.size < self.k:
+                assert(val > 0)
+                self.size += 1
+                self.insertUnmonitored(x, val)
+            else:
+                if val > 0:
+                    # replace min, any item of the min bucket will do
+                    count = self.inserts.getmin()
+                    min_item = self.inserts.popmin()
+                    del self.deletes[min_item]
+                    self.net.remove(min_item)
+                    self.insertUnmonitored(x, count + val)
+
+    def update_many(self, keys, weights=None):
+        """
+        Apply a batch of updates, collapsed into per-key insert and delete
+        totals first. Inserts are applied before deletes.
+        """
+        inserts, deletes = aggregate(keys, weights)
+        for x, val in inserts.items():
+            self.update(x, val)
+        for x, val in deletes.items():
+            self.update(x, -val)
+
+    def query(self, x):
+        """
+        Return an estimation of the amount of times `x` has ocurred.
+        """
+        if x in self.inserts:
+            return self.inserts.count(x) - self.deletes[x]
+        return 0
+
+    def find(self, x):
+        return x in self.inserts
+
+    def getmin(self):
+        # smallest insert - delete count, from the net count index
+        if not self.net:
+            return float('inf')
+        return self.net.getmin()
+
+    def topk(self, n):
+        return topk(self, n)
+
+    def heavy_hitters(self, phi):
+        return heavy_hitters(self, phi)
+
+    def getmininsert(self):
+        return self.inserts.getmin() if self.inserts else 0
+
+    def items(self):
+        # (item, insert count, delete count) of every monitored item
+        deletes = self.deletes
+        for item, insert in self.inserts.ascending():
+            yield item, insert, deletes[item]
+
+    def rebuild(self, entries):
+        # largest counts first, so every set finds its bucket at the head
+        self.inserts = CountIndex()
+        self.deletes = {}
+        self.net = CountIndex()
+        for item, insert, delete in sorted(entries, key=itemgetter(1), reverse=True):
+            self.inserts.set(item, insert)
+            self.deletes[item] = delete
+        for item, insert, delete in sorted(entries, key=lambda entry: entry[1] - entry[2], reverse=True):
+            self.net.set(item, insert - delete)
+        self.size = len(self.deletes)
+
+    def merge(self, *others):
+        """
+        Merge other SpaceSaving± summaries into this one, keeping k counters.
+        """
+        summaries = [self] + list(others)
+        self.rebuild(merged_counters(summaries, self.k))
+        self.total_items = sum(summary.total_items for summary in summaries)
+        return self
+
+    def __getitem__(self, x):
+        """
+        A convenience method to call `query`.
+        """
+        return self.query(x)
+
+    def freeze(self):
+        # immutable copy of the counters for concurrent readers
+        return SummaryView(self)
+
+    def space(self):
+        return self.k
+
+    def output(self):
+        bucket = self.inserts.min_bucket
+        while bucket is not None:
+            print(bucket.count, ": ", [(item, self.deletes[item]) for item in bucket.items])
+            bucket = bucket.next
+
+
+class SummaryView():
+    """
+    Immutable copy of the counters of a SpaceSaving± summary, made by its
+    `freeze` method. It answers the read-only methods of the summary and is
+    never touched by later updates, so it can be read from other threads
+    without a lock.
+    """
+    def __init__(self, summary):
+        self.k = summary.k
+        self.size = summary.size
+        self.total_items = summary.total_items
+        self.mininsert = summary.getmininsert()
+        self.counters = {item: (insert, delete) for item, insert, delete in summary.items()}
+
+    def isFull(self):
+        return self.size == self.k
+
+    def query(self, x):
+        if x in self.counters:
+            insert, delete = self.counters[x]
+            return insert - delete
+        return 0
+
+    def find(self, x):
+        return x in self.counters
+
+    def getmin(self):
+        if not self.counters:
+            return float('inf')
+        return min(insert - delete for insert, delete in self.counters.values())
+
+    def getmininsert(self):
+        return self.mininsert
+
+    def items(self):
+        for item, (insert, delete) in self.counters.items():
+            yield item, insert, delete
+
+    def ranked(self):
+        # (item, lower, upper) by decreasing estimate, as topk and heavy_hitters report them
+        error = self.mininsert if self.isFull() else 0
+        estimates = sorted(((item, insert - delete) for item, (insert, delete) in self.counters.items()), key=itemgetter(1), reverse=True)
+        return [(item, max(0, estimate - error), estimate) for item, estimate in estimates]
+
+    def topk(self, n):
+        return self.ranked()[:n]
+
+    def heavy_hitters(self, phi):
+        threshold = phi * self.total_items
+        return [entry for entry in self.ranked() if entry[2] >= threshold]
+
+    def __getitem__(self, x):
+        return self.query(x)
+
+    def space(self):
+        return self.k
+
+
 class DoubleSpaceSaving():
-    def __init__(self, eps, spacebudget):
+    # summary selects the SpaceSaving± engine, SpaceSaving (heap) or StreamSummary
+    def __init__(self, eps, spacebudget, summary=SpaceSaving):
         insertSpace = (spacebudget + int(1/eps))//2
-        self.InsertSpacesaving = SpaceSaving(insertSpace)
-        self.DeleteSpacesaving = SpaceSaving(spacebudget - insertSpace)
+        self.InsertSpacesaving = summary(insertSpace)
+        self.DeleteSpacesaving = summary(spacebudget - insertSpace)
     def update(self, item, weight=1, insert=True):
         if insert:
             self.InsertSpacesaving.update(item, weight)
         else:
             self.DeleteSpacesaving.update(item, weight)
+    def update_many(self, keys, weights=None):
+        # positive weights are insertions, negative weights deletions
+        inserts, deletes = aggregate(keys, weights)
+        for item, weight in inserts.items():
+            self.InsertSpacesaving.update(item, weight)
+        for item, weight in deletes.items():
+            self.DeleteSpacesaving.update(item, weight)
+    def merge(self, *others):
+        self.InsertSpacesaving.merge(*[other.InsertSpacesaving for other in others])
+        self.DeleteSpacesaving.merge(*[other.DeleteSpacesaving for other in others])
+        return self
     def query(self, item):
         insertCount = self.InsertSpacesaving.query(item)
         deleteCount = self.DeleteSpacesaving.query(item)
         return max(0, insertCount - deleteCount)
-    
\ No newline at end of file
+    def freeze(self):
+        # read-only copy with both halves frozen
+        view = copy.copy(self)
+        view.InsertSpacesaving = self.InsertSpacesaving.freeze()
+        view.DeleteSpacesaving = self.DeleteSpacesaving.freeze()
+        return view
+    
+
+
+class WindowedSpaceSaving():
+    """
+    Sliding-window SpaceSaving±: a ring of the last `epochs` per-epoch
+    DoubleSpaceSaving summaries. Epochs end every `epoch_length` updates, or
+    whenever `advance` is called (e.g. once a minute). Advancing drops the
+    oldest epoch in O(1), so memory stays at epochs * spacebudget counters.
+    Window queries add up the epochs: inserts and deletes are summed
+    separately, so a deletion may refer to an insertion of an earlier epoch.
+    Against the inserts minus deletes of the retained epochs, the error is
+    at most the sum of the per-epoch errors. Deletions are kept after the
+    epoch holding their insertion expires, so an item with inserts in that
+    epoch can be estimated below its count among the live insertions, down
+    to 0.
+    """
+    def __init__(self, eps, spacebudget, epochs, epoch_length=None, summary=SpaceSaving):
+        assert epochs >= 1
+        self.eps = eps
+        self.spacebudget = spacebudget
+        self.epoch_length = epoch_length
+        self.summary = summary
+        self.epochs = deque(maxlen=epochs)
+        self.advance()
+
+    def advance(self):
+        # start a new epoch, expiring the oldest one once the ring is full
+        self.epochs.append(DoubleSpaceSaving(self.eps, self.spacebudget, self.summary))
+        self.epoch_items = 0
+
+    def update(self, item, weight=1, insert=True):
+        if self.epoch_length is not None and self.epoch_items == self.epoch_length:
+            self.advance()
+        self.epochs[-1].update(item, weight, insert)
+        self.epoch_items += 1
+
+    def update_many(self, keys, weights=None):
+        # positive weights are insertions, negative weights deletions
+        if self.epoch_length is None:
+            self.epochs[-1].update_many(keys, weights)
+            return
+        start = 0
+        while start < len(keys):
+            if self.epoch_items == self.epoch_length:
+                self.advance()
+            end = min(len(keys), start + self.epoch_length - self.epoch_items)
+            self.epochs[-1].update_many(keys[start:end], None if weights is None else weights[start:end])
+            self.epoch_items += end - start
+            start = end
+
+    def query(self, item):
+        insertCount = sum(epoch.InsertSpacesaving.query(item) for epoch in self.epochs)
+        deleteCount = sum(epoch.DeleteSpacesaving.query(item) for epoch in self.epochs)
+        return max(0, insertCount - deleteCount)
+
+    def topk(self, n):
+        """
+        The n items with the largest window estimates as (item, lower,
+        upper), like the module level topk, from one pass over every
+        epoch's counters. Insert halves overestimate by at most their
+        getmininsert(), delete halves are off by at most theirs either way
+        (unmonitored deletes read as 0), so with I and D the sums of these
+        over the epochs, the net count of the retained epochs (see the class
+        docstring) lies in [estimate - I - D, estimate + D].
+        """
+        counts = defaultdict(int)
+        for epoch in self.epochs:
+            for item, insert, delete in epoch.InsertSpacesaving.items():
+                counts[item] += insert - delete
+        for epoch in self.epochs:
+            for item, insert, delete in epoch.DeleteSpacesaving.items():
+                if item in counts:
+                    counts[item] -= insert - delete
+        def error(summary):
+            return summary.getmininsert() if summary.isFull() else 0
+        insert_error = sum(error(epoch.InsertSpacesaving) for epoch in self.epochs)
+        delete_error = sum(error(epoch.DeleteSpacesaving) for epoch in self.epochs)
+        top = heapq.nlargest(n, counts.items(), key=itemgetter(1))
+        return [(item, max(0, count - insert_error - delete_error), max(0, count + delete_error)) for item, count in top]
+
+    def space(self):
+        return self.epochs.maxlen * self.spacebudget
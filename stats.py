@@ -0,0 +1,292 @@
+"""
+Optional event counters for the sketch hot paths.
+
+    s = SpaceSaving(1000)
+    stats.enable(s)
+    s.update_many(keys, weights)
+    stats.export(s)
+    {'replacements': ..., 'sift_swaps': ..., 'updates': ..., 'update_seconds': ..., ...}
+
+`enable` shadows the instrumented methods of one instance with counting
+wrappers in its __dict__; the classes are not touched, so a sketch without
+stats runs exactly the code it runs otherwise and `disable` restores it.
+Every sketch counts updates (keys of batches included), batches and
+update_seconds; sketches with a hash function also report hash_seconds and
+maintenance_seconds, the update time spent outside it. Nested sketches
+(the halves of a DSS, the levels of a HierarchicalHeavyHitters, ...) get
+their own counters, exported with their name as a prefix as in
+memory.usage. The wrappers close over the instance: disable a sketch
+before pickling or copying it.
+"""
+from time import perf_counter
+
+from spacesaving import SpaceSaving, IntSpaceSaving, StreamSummary, DoubleSpaceSaving, WindowedSpaceSaving
+from unbiasedSpaceSaving import UnbiasedSpaceSaving, UnbiasedDSS
+from githubCountMin import CountMinSketch, VectorizedCountMinSketch
+from CSSS import CSSS_CountSketch, CSSS_sketch
+from Panakos import Panakos
+from HeavyKeeper import HeavyKeeper, heavykeeper_minheap, ssummary
+from hhh import HierarchicalHeavyHitters
+from memory import COMPONENTS
+
+
+class Stats():
+    def __init__(self):
+        self.counters = {}
+        self.shadowed = [] # instrumented method names, in install order
+        self.depth = 0 # > 0 inside an update, nested update calls are not counted again
+
+    def shadow(self, sketch, name, make):
+        # replace sketch.name by make(current sketch.name) on the instance only
+        self.shadowed.append(name)
+        setattr(sketch, name, make(getattr(sketch, name)))
+
+    def as_dict(self):
+        counters = dict(self.counters)
+        if "hash_seconds" in counters:
+            counters["maintenance_seconds"] = counters["update_seconds"] - counters["hash_seconds"]
+        return counters
+
+# --- wrappers ---
+
+def counted(stats, event):
+    counters = stats.counters
+    counters.setdefault(event, 0)
+    def make(method):
+        def wrapper(*args, **kwargs):
+            counters[event] += 1
+            return method(*args, **kwargs)
+        return wrapper
+    return make
+
+def timed_update(stats, batch):
+    counters = stats.counters
+    for name in ("updates", "batches", "update_seconds"):
+        counters.setdefault(name, 0)
+    def make(method):
+        def wrapper(*args, **kwargs):
+            if stats.depth:
+                return method(*args, **kwargs)
+            stats.depth = 1
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                counters["update_seconds"] += perf_counter() - start
+                stats.depth = 0
+                if batch:
+                    counters["batches"] += 1
+                    counters["updates"] += len(args[0])
+                else:
+                    counters["updates"] += 1
+        return wrapper
+    return make
+
+def timed_hash(stats):
+    # only hashing done inside an update is timed, queries hash too
+    counters = stats.counters
+    counters.setdefault("hash_seconds", 0)
+    def make(method):
+        def wrapper(*args):
+            if not stats.depth:
+                return method(*args)
+            start = perf_counter()
+            result = method(*args)
+            counters["hash_seconds"] += perf_counter() - start
+            return result
+        return wrapper
+    return make
+
+# --- per class events ---
+
+def summary_events(sketch, stats):
+    # misses: unmonitored inserts into a full summary, replacements: misses that took the min counter
+    counters = stats.counters
+    for name in ("misses", "replacements", "unmonitored_deletes"):
+        counters.setdefault(name, 0)
+    def make(method):
+        find, isFull = sketch.find, sketch.isFull
+        def update(x, val):
+            if find(x) or not isFull():
+                return method(x, val)
+            if val <= 0:
+                counters["unmonitored_deletes"] += 1
+                return method(x, val)
+            counters["misses"] += 1
+            result = method(x, val)
+            if find(x):
+                counters["replacements"] += 1
+            return result
+        return update
+    stats.shadow(sketch, "update", make)
+
+def heap_events(sketch, stats):
+    # sift_swaps / sifts is the mean sift depth
+    summary_events(sketch, stats)
+    stats.shadow(sketch, "swap", counted(stats, "sift_swaps"))
+    stats.shadow(sketch, "updateMonitored", counted(stats, "sifts"))
+    stats.shadow(sketch, "insertUnmonitored", counted(stats, "sifts"))
+
+def int_heap_events(sketch, stats):
+    summary_events(sketch, stats)
+    stats.shadow(sketch, "swap", counted(stats, "sift_swaps"))
+    stats.shadow(sketch, "siftUp", counted(stats, "sifts"))
+    stats.shadow(sketch, "siftDown", counted(stats, "sifts"))
+
+def topk_store_events(sketch, stats):
+    stats.shadow(sketch, "replace_min", counted(stats, "replacements"))
+    if isinstance(sketch, heavykeeper_minheap):
+        stats.shadow(sketch, "_swap", counted(stats, "sift_swaps"))
+        stats.shadow(sketch, "_bubble_up", counted(stats, "sifts"))
+        stats.shadow(sketch, "_bubble_down", counted(stats, "sifts"))
+
+def heavykeeper_events(sketch, stats):
+    # collisions: visited buckets held by another fingerprint, decays: collisions
+    # that lowered the count, takeovers: buckets that switched to the fingerprint
+    counters = stats.counters
+    for name in ("collisions", "decays", "takeovers"):
+        counters.setdefault(name, 0)
+    def make(method):
+        def update_slots(item, slots, fp, increment):
+            fps, counts = sketch.fp_view, sketch.count_view
+            before = [(fps[slot], counts[slot]) for slot in slots]
+            result = method(item, slots, fp, increment)
+            for slot, (old_fp, old_count) in zip(slots, before):
+                if old_fp == fp:
+                    continue
+                if old_count > 0:
+                    counters["collisions"] += 1
+                    if counts[slot] < old_count:
+                        counters["decays"] += 1
+                if fps[slot] == fp:
+                    counters["takeovers"] += 1
+            return result
+        return update_slots
+    stats.shadow(sketch, "update_slots", make)
+
+def panakos_events(sketch, stats):
+    # moves between the tiers: bitmap, CountMin (more than once), SpaceSaving
+    counters = stats.counters
+    events = ("bitmap_sets", "bitmap_clears", "countmin_promotions", "countmin_demotions", "spacesaving_promotions")
+    for name in events:
+        counters.setdefault(name, 0)
+    def make(method):
+        find = sketch.SpaceSaving.find
+        def update_hashed(x, bit_position, idx, weight):
+            byte, mask = bit_position >> 3, 1 << (bit_position & 7)
+            bitmap, morethanonce = sketch.bitmap_view, sketch.morethanonce_view
+            bit, more, monitored = bitmap[byte] & mask, morethanonce[byte] & mask, find(x)
+            result = method(x, bit_position, idx, weight)
+            if bit != bitmap[byte] & mask:
+                counters["bitmap_clears" if bit else "bitmap_sets"] += 1
+            if more != morethanonce[byte] & mask:
+                counters["countmin_demotions" if more else "countmin_promotions"] += 1
+            if not monitored and find(x):
+                counters["spacesaving_promotions"] += 1
+            return result
+        return update_hashed
+    stats.shadow(sketch, "update_hashed", make)
+
+def csss_events(sketch, stats):
+    # sampled: updates passed to the count sketch, epochs: routine_a halvings
+    counters = stats.counters
+    for name in ("sampled", "epochs"):
+        counters.setdefault(name, 0)
+    def make(method):
+        def wrapper(*args, **kwargs):
+            samples, p = sketch.samples, sketch.p
+            result = method(*args, **kwargs)
+            counters["sampled"] += sketch.samples - samples
+            counters["epochs"] += sketch.p - p
+            return result
+        return wrapper
+    stats.shadow(sketch, "update", make)
+    stats.shadow(sketch, "update_many", make)
+
+def windowed_events(sketch, stats):
+    # new epochs get their own counters, expired ones take theirs with them
+    def make(method):
+        def advance():
+            stats.counters["advances"] += 1
+            method()
+            enable(sketch.epochs[-1])
+        return advance
+    stats.counters.setdefault("advances", 0)
+    stats.shadow(sketch, "advance", make)
+
+# class -> (single update methods, batch update methods, hash methods, events)
+INSTRUMENT = {
+    SpaceSaving: (("update",), ("update_many",), (), heap_events),
+    IntSpaceSaving: (("update",), ("update_many",), (), int_heap_events),
+    StreamSummary: (("update",), ("update_many",), (), summary_events),
+    UnbiasedSpaceSaving: (("update",), ("update_many",), (), heap_events),
+    DoubleSpaceSaving: (("update",), ("update_many",), (), None),
+    WindowedSpaceSaving: (("update",), ("update_many",), (), windowed_events),
+    UnbiasedDSS: (("update",), ("update_many",), (), None),
+    CountMinSketch: (("add", "add_at"), (), ("_hash",), None),
+    VectorizedCountMinSketch: (("add",), ("add_many",), ("_hash", "_hash_many"), None),
+    # update hashes inline, only the batch hash is timed
+    CSSS_CountSketch: (("update", "add"), ("update_many",), ("hash_many",), None),
+    CSSS_sketch: (("update",), ("update_many",), (), csss_events),
+    Panakos: (("update",), ("update_many",), ("_hash", "_hash_many"), panakos_events),
+    HeavyKeeper: (("update",), ("update_many",), ("_hash", "_hash_many"), heavykeeper_events),
+    heavykeeper_minheap: (("update",), (), (), topk_store_events),
+    ssummary: (("update",), (), (), topk_store_events),
+    HierarchicalHeavyHitters: (("update",), ("update_many",), (), None),
+}
+
+def children(sketch):
+    # nested sketches, as in memory.COMPONENTS
+    return COMPONENTS[type(sketch)](sketch)[1]
+
+def enable(sketch):
+    """
+    Start counting on `sketch` and its nested sketches, from zero.
+    Returns the sketch.
+    """
+    cls = type(sketch)
+    if cls not in INSTRUMENT:
+        raise TypeError("no stats for %s" % cls.__name__)
+    if "stats" in vars(sketch):
+        raise ValueError("stats are already enabled")
+    single, batch, hashes, events = INSTRUMENT[cls]
+    stats = Stats()
+    # events first, so the update timers include them
+    if events is not None:
+        events(sketch, stats)
+    for name in hashes:
+        stats.shadow(sketch, name, timed_hash(stats))
+    for name in single:
+        stats.shadow(sketch, name, timed_update(stats, False))
+    for name in batch:
+        stats.shadow(sketch, name, timed_update(stats, True))
+    sketch.stats = stats
+    for child in children(sketch).values():
+        enable(child)
+    return sketch
+
+def disable(sketch):
+    """
+    Remove the counters of `sketch` and its nested sketches, restoring the
+    class methods.
+    """
+    stats = vars(sketch).pop("stats", None)
+    if stats is None:
+        return
+    for name in set(stats.shadowed):
+        delattr(sketch, name)
+    for child in children(sketch).values():
+        disable(child)
+
+def export(sketch, prefix=""):
+    """
+    Flat {name: value} of the counters of `sketch` and its nested sketches,
+    empty when stats are not enabled.
+    """
+    stats = vars(sketch).get("stats")
+    if stats is None:
+        return {}
+    out = {prefix + name: value for name, value in stats.as_dict().items()}
+    for name, child in children(sketch).items():
+        out.update(export(child, prefix + name + "."))
+    return out
@@ -1,13 +1,15 @@
 from collections import defaultdict
-import random
+from operator import itemgetter
+from spacesaving import aggregate
+from rng import BufferedRandom
 class UnbiasedSpaceSaving():
-    def __init__(self, k=100):
+    def __init__(self, k=100, seed=0):
         self.k = k
         self.size = 0
         self.weight_heap = [] # Min heap
         self.item_to_indices = defaultdict(int)
         self.total_items = 0
-        random.seed(0)
+        self.rng = BufferedRandom(seed) # own uniforms for the min replacement
     
     def parent(self, i):
         return (i-1)//2
@@ -99,12 +101,20 @@ class UnbiasedSpaceSaving():
                     weight_index = self.item_to_indices[min_item]
                     assert self.weight_heap[weight_index][0] == min_item
                     curr_weight = self.weight_heap[weight_index][1]
-                    if random.random() < 1.0 * val / curr_weight:
+                    if self.rng.random() < 1.0 * val / curr_weight:
                         # replace min with prob val/weight
                         self.weight_heap[weight_index][0] = x
                         del self.item_to_indices[min_item]
                         self.item_to_indices[x] = weight_index
-                        
+
+    def update_many(self, keys, weights=None):
+        # collapse the batch into per-key totals, then one update per distinct key;
+        # insert-only like update, UnbiasedDSS routes deletions to its own summary
+        inserts, deletes = aggregate(keys, weights)
+        assert not deletes, "UnbiasedSpaceSaving takes insertions only"
+        for x, val in inserts.items():
+            self.update(x, val)
+
     def query(self, x):
         """
         Return an estimation of the amount of times `x` has ocurred.
@@ -114,6 +124,28 @@ class UnbiasedSpaceSaving():
             return self.weight_heap[index][1]
         return 0
 
+    def find(self, x):
+        return x in self.item_to_indices
+
+    def merge(self, *others):
+        """
+        Merge other unbiased summaries into this one, keeping k counters.
+        The combined counts are replayed as weighted updates, largest first,
+        so the surplus items go through the same randomized min replacement
+        and the estimates stay unbiased.
+        """
+        counts = defaultdict(int)
+        for summary in [self] + list(others):
+            for item, count in summary.weight_heap:
+                counts[item] += count
+        self.size = 0
+        self.weight_heap = []
+        self.item_to_indices = defaultdict(int)
+        self.total_items = 0
+        for item, count in sorted(counts.items(), key=itemgetter(1), reverse=True):
+            self.update(item, count)
+        return self
+
     def __getitem__(self, x):
         """
         A convenience method to call `query`.
@@ -128,16 +160,27 @@ class UnbiasedSpaceSaving():
         print("map: ", self.item_to_indices)
 
 class UnbiasedDSS():
-    def __init__(self, eps, k):
+    def __init__(self, eps, k, seed=0):
         assert eps < 1.0
         insertSpace = (k + int(1/eps))//2
-        self.insertUSS = UnbiasedSpaceSaving(insertSpace)
-        self.deleteUSS = UnbiasedSpaceSaving(k - insertSpace)
+        self.insertUSS = UnbiasedSpaceSaving(insertSpace, seed)
+        self.deleteUSS = UnbiasedSpaceSaving(k - insertSpace, seed + 1)
     def update(self, item, weight=1, insert = True):
         if insert:
             self.insertUSS.update(item, weight)
         else:
             self.deleteUSS.update(item, weight)
+    def update_many(self, keys, weights=None):
+        # positive weights are insertions, negative weights deletions
+        inserts, deletes = aggregate(keys, weights)
+        for item, weight in inserts.items():
+            self.insertUSS.update(item, weight)
+        for item, weight in deletes.items():
+            self.deleteUSS.update(item, weight)
+    def merge(self, *others):
+        self.insertUSS.merge(*[other.insertUSS for other in others])
+        self.deleteUSS.merge(*[other.deleteUSS for other in others])
+        return self
     def query(self, item):
         insertCount = self.insertUSS.query(item)
         deleteCount = self.deleteUSS.query(item)
@@ -0,0 +1,92 @@
+"""
+Consistent reads while a single writer keeps ingesting.
+
+    shared = Published(SpaceSaving(1000), every=10000)
+    # writer thread
+    for batch in batches:
+        shared.update_many(batch)
+        shared.sync() # e.g. whenever the input queue runs dry
+    # any reader thread
+    shared.view().query(x)
+
+The writer owns the live sketch. Between two updates it publishes a frozen
+copy (the sketch's `freeze` method: a copy of the compact counters) every
+`every` updates, or as soon as a reader asks for a fresh view. A writer
+that may go idle calls `sync()` before it does, so readers waiting for a
+fresh view are served. Publishing swaps one reference, and a published view
+is never mutated afterwards, so readers take no lock and cannot observe a
+half applied update; the update path takes the uncontended lock once.
+"""
+import threading
+
+
+class Published():
+    def __init__(self, sketch, every=None):
+        self.sketch = sketch
+        self.every = every
+        self.pending = 0 # updates applied since the last publish
+        self.wanted = False
+        self.epoch = 0
+        self.published = threading.Condition()
+        self.current = sketch.freeze()
+
+    # --- writer side, all from one thread ---
+
+    def update(self, *args, **kwargs):
+        self.sketch.update(*args, **kwargs)
+        self.tick(1)
+
+    def add(self, *args, **kwargs):
+        self.sketch.add(*args, **kwargs)
+        self.tick(1)
+
+    def update_many(self, keys, weights=None):
+        self.sketch.update_many(keys, weights)
+        self.tick(len(keys))
+
+    def tick(self, n):
+        with self.published:
+            self.pending += n
+            due = self.wanted or (self.every and self.pending >= self.every)
+        if due:
+            self.publish()
+
+    def sync(self):
+        # publish if a reader is waiting, for writers about to go idle
+        with self.published:
+            due = self.wanted and self.pending
+        if due:
+            self.publish()
+
+    def publish(self):
+        view = self.sketch.freeze()
+        with self.published:
+            self.current = view
+            self.epoch += 1
+            self.pending = 0
+            self.wanted = False
+            self.published.notify_all()
+
+    # --- reader side, from any thread ---
+
+    def view(self):
+        # latest published view, never blocks
+        return self.current
+
+    def fresh_view(self, timeout=1.0):
+        """
+        A view that includes every update the writer has completed, waiting
+        up to `timeout` seconds for the writer's next update or `sync()` to
+        publish it. Raises TimeoutError if the writer does not publish in
+        time rather than returning a stale view.
+        """
+        if timeout is None or timeout < 0:
+            raise ValueError("fresh_view needs a finite timeout, an idle writer never publishes")
+        with self.published:
+            if not self.pending:
+                return self.current
+            epoch = self.epoch
+            self.wanted = True
+            if not self.published.wait_for(lambda: self.epoch != epoch, timeout):
+                raise TimeoutError("no view published within %gs, the writer must call sync() when idle" % timeout)
+            return self.current